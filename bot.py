@@ -16,7 +16,11 @@ from runware import Runware
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from infrastructure.database.setup import create_engine, create_session_pool
-from infrastructure.scheduler.jobs import setup_rating_inflation_task
+from infrastructure.scheduler.jobs import (
+    setup_chat_messages_partitions_task,
+    setup_rating_events_compaction_task,
+    setup_rating_inflation_task,
+)
 from tgbot.config import Config, load_config
 from tgbot.handlers.essential.fun import fun_router
 from tgbot.handlers.groups import (
@@ -28,8 +32,10 @@ from tgbot.handlers.groups import (
 from tgbot.handlers.private.basic import basic_router
 from tgbot.handlers.private.admin import admin_router
 from tgbot.middlewares.activity import UserActivityMiddleware
+from tgbot.middlewares.profiles import ProfileRefreshMiddleware
 from tgbot.middlewares.bot_messages import BotMessages
 from tgbot.middlewares.chat_admins import ChatAdminsMiddleware
+from tgbot.middlewares.chat_archive import ChatArchiveMiddleware
 from tgbot.middlewares.database import DatabaseMiddleware
 from tgbot.middlewares.policy_content import OpenAIModerationMiddleware
 from tgbot.middlewares.rating_check_middleware import RatingCheckMiddleware
@@ -39,23 +45,82 @@ from tgbot.middlewares.ratings_cache import (
 from tgbot.middlewares.throttling import ThrottlingMiddleware
 from tgbot.misc.default_commands import set_default_commands
 from tgbot.services import broadcaster
+from tgbot.services.activity import ActivityTracker, migrate_activity_keys
+from tgbot.services.ai_service.history_analysis import HistorySummarizer
+from tgbot.services.cache_profiles import ProfileRefresher, drop_profiles_from_fsm
+from tgbot.services.chat_admins import ChatAdminsCache
+from tgbot.services.chat_archive import ChatMessageArchiver
+from tgbot.services.chat_history import ChatHistoryStore, migrate_history_from_fsm
+from tgbot.services.command_usage_tracker import (
+    CommandMenuUpdater,
+    migrate_command_usage_from_fsm,
+)
+from tgbot.services.message_deleter import MessageDeleter
+from tgbot.services.message_recorder import MessageUserRecorder
+from tgbot.services.rating import ReactionDedupe
+from tgbot.services.rating_events import RatingEventRecorder
+from tgbot.services.token_usage import migrate_usage_from_fsm
 from tgbot.misc.phrases import bot_startup_phrases
 from aiogram.client.default import DefaultBotProperties
 from tgbot.middlewares.command_usage_middleware import CommandUsageMiddleware
 from tgbot.handlers.groups.ai_image import ai_image_router
 
 
-async def on_startup(bot: Bot, config: Config, client: Client, scheduler: AsyncIOScheduler) -> None:
+async def on_startup(
+    bot: Bot,
+    config: Config,
+    client: Client,
+    scheduler: AsyncIOScheduler,
+    storage: RedisStorage,
+    message_recorder: MessageUserRecorder,
+    message_deleter: MessageDeleter,
+    activity_tracker: ActivityTracker,
+    command_menu: CommandMenuUpdater,
+    rating_events: RatingEventRecorder,
+    profile_refresher: ProfileRefresher,
+    chat_history: ChatHistoryStore,
+    chat_archiver: ChatMessageArchiver,
+) -> None:
     admin_ids = config.tg_bot.admin_ids
     await broadcaster.broadcast(bot, admin_ids, random.choice(bot_startup_phrases))
     await set_default_commands(bot)
+    await migrate_usage_from_fsm(storage, bot)
+    await migrate_activity_keys(storage.redis)
+    await migrate_command_usage_from_fsm(storage, bot)
+    await drop_profiles_from_fsm(storage, bot)
+    await migrate_history_from_fsm(storage, bot, chat_history)
     await client.start()
+    await message_recorder.start()
+    await message_deleter.start()
+    await activity_tracker.start()
+    await command_menu.start()
+    await rating_events.start()
+    await profile_refresher.start()
+    await chat_archiver.start()
     scheduler.start()
 
 
-async def shutdown(client: Client, scheduler: AsyncIOScheduler) -> None:
+async def shutdown(
+    client: Client,
+    scheduler: AsyncIOScheduler,
+    message_recorder: MessageUserRecorder,
+    message_deleter: MessageDeleter,
+    activity_tracker: ActivityTracker,
+    command_menu: CommandMenuUpdater,
+    rating_events: RatingEventRecorder,
+    profile_refresher: ProfileRefresher,
+    chat_archiver: ChatMessageArchiver,
+) -> None:
     await client.stop()
     scheduler.shutdown()
+    await message_deleter.close()
+    # Drain buffered writes before the event loop goes away
+    await message_recorder.close()
+    await activity_tracker.close()
+    await command_menu.close()
+    await rating_events.close()
+    await profile_refresher.close()
+    await chat_archiver.close()
 
 def register_global_middlewares(
     dp: Dispatcher,
@@ -64,6 +129,12 @@ def register_global_middlewares(
     openai_client,
     storage,
     bot: Bot,
+    message_recorder: MessageUserRecorder,
+    activity_tracker: ActivityTracker,
+    chat_admins_cache: ChatAdminsCache,
+    command_menu: CommandMenuUpdater,
+    profile_refresher: ProfileRefresher,
+    chat_archiver: ChatMessageArchiver,
 ):
     """
     Register global middlewares for the given dispatcher.
@@ -84,13 +155,14 @@ def register_global_middlewares(
         dp.callback_query.outer_middleware(middleware_type)
     dp.message.middleware(ThrottlingMiddleware(storage, bot))
     dp.message_reaction.middleware(ThrottlingMiddleware(storage, bot))
-    dp.update.outer_middleware(DatabaseMiddleware(session_pool))
-    dp.message.outer_middleware(MessageUserMiddleware())
-    dp.message.middleware(CommandUsageMiddleware())
-    UserActivityMiddleware(storage).setup(dp)
-    dp.update.outer_middleware(ChatAdminsMiddleware(storage))
+    dp.update.outer_middleware(DatabaseMiddleware(session_pool, storage.redis))
+    dp.message.outer_middleware(MessageUserMiddleware(message_recorder))
+    dp.message.outer_middleware(ChatArchiveMiddleware(chat_archiver))
+    dp.message.middleware(CommandUsageMiddleware(command_menu))
+    UserActivityMiddleware(activity_tracker).setup(dp)
+    ProfileRefreshMiddleware(profile_refresher).setup(dp)
+    dp.update.outer_middleware(ChatAdminsMiddleware(chat_admins_cache))
     dp.message.middleware(RatingCheckMiddleware())
-    dp.message.middleware(CommandUsageMiddleware())
     
 
 def setup_logging():
@@ -158,8 +230,18 @@ async def main():
     )
     dp = Dispatcher(storage=storage, client=client, fsm_strategy=FSMStrategy.CHAT)
     session_pool = create_session_pool(engine)
-    ratings_cache = {}
+    message_recorder = MessageUserRecorder(session_pool)
+    message_deleter = MessageDeleter(bot, storage.redis)
+    activity_tracker = ActivityTracker(storage.redis)
+    chat_admins_cache = ChatAdminsCache(storage.redis)
+    command_menu = CommandMenuUpdater(bot, storage.redis)
+    rating_events = RatingEventRecorder(session_pool)
+    profile_refresher = ProfileRefresher(bot, storage.redis)
+    chat_history = ChatHistoryStore(storage.redis)
+    chat_archiver = ChatMessageArchiver(session_pool)
+    reaction_dedupe = ReactionDedupe(storage.redis)
     openai_client = AsyncOpenAI(api_key=config.openai.api_key)
+    history_summarizer = HistorySummarizer(openai_client, storage.redis)
 
     elevenlabs_client = AsyncElevenLabs(
         api_key=config.elevenlabs.api_key,
@@ -174,6 +256,8 @@ async def main():
     
     # Setup rating inflation task
     setup_rating_inflation_task(scheduler, bot, session_pool, storage)
+    setup_rating_events_compaction_task(scheduler, session_pool)
+    setup_chat_messages_partitions_task(scheduler, session_pool)
 
     dp.include_routers(
         payment_router,
@@ -187,19 +271,42 @@ async def main():
     )
 
 
-    register_global_middlewares(dp, config, session_pool, openai_client, storage ,bot=bot)
+    register_global_middlewares(
+        dp,
+        config,
+        session_pool,
+        openai_client,
+        storage,
+        bot=bot,
+        message_recorder=message_recorder,
+        activity_tracker=activity_tracker,
+        chat_admins_cache=chat_admins_cache,
+        command_menu=command_menu,
+        profile_refresher=profile_refresher,
+        chat_archiver=chat_archiver,
+    )
 
     runware_client = Runware(api_key=config.runware.api_key, log_level=logging.INFO)
     await runware_client.connect()
 
     dp.workflow_data.update(
-        ratings_cache=ratings_cache,
+        reaction_dedupe=reaction_dedupe,
         anthropic_client=anthropic_client,
         openai_client=openai_client,
         runware_client=runware_client,
         elevenlabs_client=elevenlabs_client,
+        message_recorder=message_recorder,
+        message_deleter=message_deleter,
+        activity_tracker=activity_tracker,
+        chat_admins_cache=chat_admins_cache,
+        command_menu=command_menu,
+        rating_events=rating_events,
+        profile_refresher=profile_refresher,
+        chat_history=chat_history,
+        chat_archiver=chat_archiver,
+        history_summarizer=history_summarizer,
     )
-    bot.session.middleware(BotMessages(session_pool , storage))
+    bot.session.middleware(BotMessages(message_recorder, activity_tracker, chat_archiver))
     await bot.delete_webhook()
     dp.startup.register(on_startup)
     dp.shutdown.register(shutdown)
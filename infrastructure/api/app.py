@@ -5,6 +5,7 @@ from aiogram import Bot
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from fastapi import APIRouter, FastAPI, HTTPException
 from pydantic import BaseModel
+from redis.asyncio import Redis
 import random
 from typing import List
 import time
@@ -15,12 +16,15 @@ from infrastructure.api.utils import parse_init_data, validate_telegram_data
 from infrastructure.database.repo.requests import RequestsRepo
 from infrastructure.database.setup import create_engine, create_session_pool
 from tgbot.config import load_config
+from tgbot.services.rating_events import RatingEventSource, rating_event
 
 app = FastAPI()
 config = load_config()
 engine = create_engine(config.db.construct_sqlalchemy_url())
 session_pool = create_session_pool(engine)
 bot = Bot(token=config.tg_bot.token)
+# Shared with the bot, so balance changes here update its rating cache
+redis = Redis.from_url(config.redis.dsn())
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,10 +71,13 @@ class SpinResponse(BaseModel):
 async def get_user_balance(user_id: int, chat_id: int, repo: RequestsRepo) -> int:
     return await repo.rating_users.get_rating_by_user_id(user_id, chat_id) or 0
 
-async def update_user_balance(
-    user_id: int, chat_id: int, new_balance: int, repo: RequestsRepo
-) -> None:
-    await repo.rating_users.update_rating_by_user_id(user_id, chat_id, new_balance)
+async def change_user_balance(
+    user_id: int, chat_id: int, stake: int, win_amount: int, repo: RequestsRepo
+) -> tuple[int, int] | None:
+    """Charge the stake and pay out the winnings in one statement, if the balance covers the stake."""
+    return await repo.rating_users.change_rating_if_at_least(
+        user_id, chat_id, win_amount - stake, stake
+    )
 
 # Game logic
 SYMBOLS = ["🍋", "🍒", "🍇", "🎰", "7️⃣"]
@@ -97,7 +104,7 @@ router = APIRouter(prefix="/chatmoderator/api")
 @router.get("/balance", response_model=BalanceResponse)
 async def get_balance(user_id: int, chat_id: int):
     async with session_pool() as session:
-        repo = RequestsRepo(session)
+        repo = RequestsRepo(session, redis)
         balance = await get_user_balance(user_id, chat_id, repo)
     return {"balance": balance}
 
@@ -118,19 +125,32 @@ async def spin(request: SpinRequest):
         raise HTTPException(status_code=400, detail="Stake must be positive")
 
     async with session_pool() as session:
-        repo = RequestsRepo(session)
-        current_balance = await get_user_balance(request.user_id, request.chat_id, repo)
-
-        if current_balance < request.stake:
-            raise HTTPException(status_code=400, detail="Insufficient balance")
-
+        repo = RequestsRepo(session, redis)
         result = [get_random_symbol() for _ in range(3)]
         winAmount = calculate_winnings(result, request.stake)
-        newBalance = current_balance - request.stake + winAmount
+        # The balance check and the change are one conditional UPDATE, so
+        # concurrent rating changes are neither overwritten nor overdrawn
+        balances = await change_user_balance(
+            request.user_id, request.chat_id, request.stake, winAmount, repo
+        )
+        if balances is None:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+
+        current_balance, newBalance = balances
         action = "win" if winAmount > 0 else "lose"
 
         print(f"Result: {result}, action: {action}, winAmount: {winAmount}, newBalance: {newBalance}")
-        await update_user_balance(request.user_id, request.chat_id, newBalance, repo)
+        await repo.rating_events.add_events(
+            [
+                rating_event(
+                    request.chat_id,
+                    request.user_id,
+                    newBalance - current_balance,
+                    RatingEventSource.CASINO,
+                    actor_id=request.user_id,
+                )
+            ]
+        )
 
         data = parse_init_data(request.InitData)
         if action == "win":
@@ -173,4 +193,5 @@ app.include_router(router)
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    await bot.session.close()
\ No newline at end of file
+    await bot.session.close()
+    await redis.aclose()
\ No newline at end of file
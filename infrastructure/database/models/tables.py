@@ -1,4 +1,8 @@
-from sqlalchemy import BIGINT, Integer, String
+import datetime
+from typing import Optional
+
+from sqlalchemy import BIGINT, Date, Index, Integer, SmallInteger, String, Text
+from sqlalchemy.dialects.postgresql import TIMESTAMP
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base, TableNameMixin
@@ -37,9 +41,76 @@ class RatingUsers(Base):
         return f"<RatingUsers user_id={self.user_id} chat_id={self.chat_id} rating={self.rating}>"
 
 
+class RatingEvents(Base):
+    __tablename__ = "RatingEvents"
+    """
+    Append-only ledger of rating changes. Old events are folded into
+    RatingEventSnapshots by the compaction job.
+    """
+    id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BIGINT)
+    target_id: Mapped[int] = mapped_column(BIGINT)
+    actor_id: Mapped[Optional[int]] = mapped_column(BIGINT, nullable=True)
+    delta: Mapped[int] = mapped_column(Integer)
+    source: Mapped[str] = mapped_column(String(32))
+    created_at: Mapped[datetime.datetime] = mapped_column(TIMESTAMP(timezone=True))
+
+    __table_args__ = (
+        Index("ix_RatingEvents_chat_target_created", "chat_id", "target_id", "created_at"),
+        Index("ix_RatingEvents_created_at", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<RatingEvents chat_id={self.chat_id} target_id={self.target_id} delta={self.delta} source={self.source}>"
+
+
+class RatingEventSnapshots(Base):
+    __tablename__ = "RatingEventSnapshots"
+    """
+    Per-day sum of compacted rating events.
+    """
+    chat_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    delta: Mapped[int] = mapped_column(Integer, default=0)
+    events: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self):
+        return f"<RatingEventSnapshots chat_id={self.chat_id} user_id={self.user_id} day={self.day} delta={self.delta}>"
+
+
 class MessageUser(Base, TableNameMixin):
     user_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
     chat_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
     message_id: Mapped[int] = mapped_column(
         Integer, primary_key=True, autoincrement=False
-    )
\ No newline at end of file
+    )
+
+
+class ChatMessages(Base):
+    __tablename__ = "ChatMessages"
+    """
+    Archive of chat messages, range-partitioned by month on ``date``.
+    The primary key doubles as the (chat_id, message_id) index.
+    """
+    chat_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
+    message_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=False)
+    date: Mapped[datetime.datetime] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    user_id: Mapped[Optional[int]] = mapped_column(BIGINT, nullable=True)
+    user_name: Mapped[str] = mapped_column(String(255))
+    username: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    content: Mapped[str] = mapped_column(Text)
+    reply_to_id: Mapped[Optional[int]] = mapped_column(BIGINT, nullable=True)
+    url: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    photo_file_id: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Prompt line rendered at ingestion; stale when render_version is outdated
+    rendered: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    render_version: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ChatMessages_chat_date", "chat_id", "date"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+
+    def __repr__(self):
+        return f"<ChatMessages chat_id={self.chat_id} message_id={self.message_id}>"
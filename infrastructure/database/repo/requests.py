@@ -1,14 +1,35 @@
+import datetime
 import logging
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from typing import List, Optional, Sequence
-
-from sqlalchemy import delete, insert, select, update
+from typing import Iterable, List, Optional, Sequence
+
+from redis.asyncio import Redis
+from sqlalchemy import (
+    BIGINT,
+    and_,
+    column,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    union_all,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from infrastructure.database.models.tables import (
     BannedStickers,
     ChatAdmins,
+    ChatMessages,
     MessageUser,
+    RatingEvents,
+    RatingEventSnapshots,
     RatingUsers,
 )
 
@@ -50,14 +71,231 @@ class ChatAdminsRepo:
         await self.session.commit()
 
 
+RATING_CACHE_TTL = 10 * 60
+LEADERBOARD_TTL = 24 * 60 * 60
+RATING_WRITE_GUARD_TTL = 60
+
+# Fills cached ratings (KEYS[3..] with ARGV[3..]) only while no rating write of
+# the chat is in flight (KEYS[1]) and none has finished since the reader took
+# the chat's version (KEYS[2] must still equal ARGV[1]). A slow reader
+# therefore never caches a value older than a write it raced with.
+RATING_CACHE_FILL_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+    return 0
+end
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+for i = 3, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i], 'EX', ARGV[2], 'NX')
+end
+return 1
+"""
+
+# Finishes a rating write of one chat: releases the in-flight mark (KEYS[1]),
+# bumps the chat's version (KEYS[2]) and drops the cached ratings it touched
+# (KEYS[4..]). ARGV holds (user_id, delta) pairs for the leaderboard (KEYS[3]),
+# which is only updated if it is already built. Deltas commute, so writes
+# finishing out of order still leave the right scores.
+RATING_WRITE_END_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+    redis.call('DECR', KEYS[1])
+end
+redis.call('INCR', KEYS[2])
+for i = 4, #KEYS do
+    redis.call('DEL', KEYS[i])
+end
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    for i = 1, #ARGV, 2 do
+        redis.call('ZINCRBY', KEYS[3], ARGV[i + 1], ARGV[i])
+    end
+end
+return 1
+"""
+
+# Replaces the leaderboard (KEYS[3]) with the (score, user_id) pairs in
+# ARGV[3..], under the same guard as RATING_CACHE_FILL_SCRIPT. A rebuild that
+# overlapped a write is dropped instead of erasing it.
+LEADERBOARD_REBUILD_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+    return 0
+end
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[3])
+for i = 3, #ARGV, 1000 do
+    redis.call('ZADD', KEYS[3], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+
 class RatingUsersRepo:
-    def __init__(self, session: AsyncSession):
+    """
+    Ratings are cached in Redis as ``rating_cache:{chat_id}:{user_id}`` when a
+    Redis client is given. Reads go through the cache and a missing row is
+    cached as an empty string. Writes never store values: they mark the chat
+    as being written (``rating_writes:{chat_id}``) before the statement and
+    afterwards drop the cached ratings they touched and bump the chat's
+    version (``rating_version:{chat_id}``). Reads only fill the cache if no
+    write overlapped them, so the cache cannot go back to an older value.
+
+    Each chat also gets a leaderboard sorted set, ``leaderboard:{chat_id}``.
+    It is built from Postgres on first use under the same guard as cache fills
+    and gets every write as a score increment, so top-N and ranks never sort
+    the table.
+    """
+
+    def __init__(self, session: AsyncSession, redis: Optional[Redis] = None):
         self.session = session
+        self.redis = redis
+        if redis is not None:
+            self._fill_script = redis.register_script(RATING_CACHE_FILL_SCRIPT)
+            self._write_end_script = redis.register_script(RATING_WRITE_END_SCRIPT)
+            self._rebuild_script = redis.register_script(LEADERBOARD_REBUILD_SCRIPT)
+
+    @staticmethod
+    def _cache_key(user_id: int, chat_id: int) -> str:
+        return f"rating_cache:{chat_id}:{user_id}"
+
+    @staticmethod
+    def _leaderboard_key(chat_id: int) -> str:
+        return f"leaderboard:{chat_id}"
+
+    @staticmethod
+    def _guard_keys(chat_id: int) -> list[str]:
+        return [f"rating_writes:{chat_id}", f"rating_version:{chat_id}"]
+
+    @staticmethod
+    def _cache_version(in_flight, version) -> Optional[str]:
+        """The version a read may fill the cache with, None if a write is in flight."""
+        if in_flight and int(in_flight) > 0:
+            return None
+        if isinstance(version, bytes):
+            version = version.decode()
+        return version or "0"
+
+    async def _get_cache_version(self, chat_id: int) -> Optional[str]:
+        return self._cache_version(*await self.redis.mget(self._guard_keys(chat_id)))
+
+    async def _fill_cache(
+        self, chat_id: int, version: Optional[str], ratings: dict[int, Optional[int]]
+    ):
+        if self.redis is None or version is None or not ratings:
+            return
+        await self._fill_script(
+            keys=[
+                *self._guard_keys(chat_id),
+                *[self._cache_key(user_id, chat_id) for user_id in ratings],
+            ],
+            args=[
+                version,
+                RATING_CACHE_TTL,
+                *["" if rating is None else rating for rating in ratings.values()],
+            ],
+        )
+
+    @asynccontextmanager
+    async def _writing(self, *chat_ids: int):
+        """
+        Wrap a rating write of the given chats. The body puts the rating change
+        of every row it changed into the yielded ``{(chat_id, user_id): delta}``.
+        """
+        written: dict[tuple[int, int], int] = {}
+        if self.redis is None:
+            yield written
+            return
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for chat_id in chat_ids:
+                in_flight, _ = self._guard_keys(chat_id)
+                pipe.incr(in_flight)
+                pipe.expire(in_flight, RATING_WRITE_GUARD_TTL)
+            await pipe.execute()
+        try:
+            yield written
+        finally:
+            by_chat: dict[int, dict[int, int]] = {chat_id: {} for chat_id in chat_ids}
+            for (chat_id, user_id), delta in written.items():
+                by_chat.setdefault(chat_id, {})[user_id] = delta
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for chat_id, ratings in by_chat.items():
+                    await self._write_end_script(
+                        keys=[
+                            *self._guard_keys(chat_id),
+                            self._leaderboard_key(chat_id),
+                            *[self._cache_key(user_id, chat_id) for user_id in ratings],
+                        ],
+                        args=[
+                            value
+                            for user_id, delta in ratings.items()
+                            for value in (user_id, delta)
+                        ],
+                        client=pipe,
+                    )
+                await pipe.execute()
+
+    async def _ensure_leaderboard(self, chat_id: int) -> bool:
+        """
+        Build the chat's leaderboard if it is missing. Returns False if it could
+        not be built because a write overlapped, so the caller should use SQL.
+        """
+        key = self._leaderboard_key(chat_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            pipe.mget(self._guard_keys(chat_id))
+            exists, guard = await pipe.execute()
+        if exists:
+            return True
+        # Taken before the SELECT, so a write committed after it fails the rebuild
+        version = self._cache_version(*guard)
+        if version is None:
+            return False
+        stmt = select(RatingUsers.user_id, RatingUsers.rating).where(
+            RatingUsers.chat_id == chat_id
+        )
+        result = await self.session.execute(stmt)
+        ratings = [(rating or 0, user_id) for user_id, rating in result.all()]
+        if not ratings:
+            return True
+        rebuilt = await self._rebuild_script(
+            keys=[*self._guard_keys(chat_id), key],
+            args=[version, LEADERBOARD_TTL, *[value for pair in ratings for value in pair]],
+        )
+        return bool(rebuilt)
+
+    async def get_leaderboard(self, chat_id: int, limit: int = 50) -> list[tuple[int, int]]:
+        """Top ``limit`` users of the chat as ``(user_id, rating)``, highest first."""
+        if self.redis is None or not await self._ensure_leaderboard(chat_id):
+            return await self.get_top_by_rating_for_chat(chat_id, limit)
+        top = await self.redis.zrevrange(
+            self._leaderboard_key(chat_id), 0, limit - 1, withscores=True
+        )
+        return [(int(user_id), int(rating)) for user_id, rating in top]
+
+    async def get_rank(self, chat_id: int, user_id: int) -> Optional[int]:
+        """1-based place of the user in the chat leaderboard."""
+        if self.redis is None:
+            return None
+        if not await self._ensure_leaderboard(chat_id):
+            rating = await self.get_rating_by_user_id(user_id, chat_id)
+            if rating is None:
+                return None
+            stmt = select(func.count()).where(
+                RatingUsers.chat_id == chat_id, RatingUsers.rating > rating
+            )
+            return (await self.session.scalar(stmt)) + 1
+        rank = await self.redis.zrevrank(self._leaderboard_key(chat_id), user_id)
+        return None if rank is None else rank + 1
 
     async def add_user_for_rating(self, user_id: int, chat_id: int, rating: int):
-        stmt = insert(RatingUsers).values(user_id=user_id, chat_id=chat_id, rating=rating)
-        await self.session.execute(stmt)
-        await self.session.commit()
+        async with self._writing(chat_id) as written:
+            stmt = insert(RatingUsers).values(user_id=user_id, chat_id=chat_id, rating=rating)
+            await self.session.execute(stmt)
+            await self.session.commit()
+            written[chat_id, user_id] = rating
 
     async def increment_rating_by_user_id(self, user_id: int, chat_id: int, increment: int):
         stmt = (
@@ -66,30 +304,176 @@ class RatingUsersRepo:
             .values(rating=RatingUsers.rating + increment)
             .returning(RatingUsers.rating)
         )
-        new_rating = await self.session.execute(stmt)
-        await self.session.commit()
-        return new_rating.scalar()
+        async with self._writing(chat_id) as written:
+            result = await self.session.execute(stmt)
+            await self.session.commit()
+            new_rating = result.scalar()
+            if new_rating is not None:
+                written[chat_id, user_id] = increment
+        return new_rating
+
+    async def upsert_rating(self, user_id: int, chat_id: int, change: int) -> tuple[int, int]:
+        """
+        Add ``change`` to the user's rating, creating the row if needed, in one
+        statement. Returns ``(previous_rating, new_rating)``; a new user starts
+        from 0.
+        """
+        stmt = (
+            pg_insert(RatingUsers)
+            .values(user_id=user_id, chat_id=chat_id, rating=change)
+            .on_conflict_do_update(
+                index_elements=[RatingUsers.user_id, RatingUsers.chat_id],
+                set_={"rating": RatingUsers.rating + change},
+            )
+            .returning(RatingUsers.rating - change, RatingUsers.rating)
+        )
+        async with self._writing(chat_id) as written:
+            result = await self.session.execute(stmt)
+            await self.session.commit()
+            previous_rating, new_rating = result.one()
+            written[chat_id, user_id] = change
+        return previous_rating, new_rating
+
+    async def change_rating_if_at_least(
+        self, user_id: int, chat_id: int, change: int, minimum: int
+    ) -> Optional[tuple[int, int]]:
+        """
+        Add ``change`` to the user's rating only if it is at least ``minimum``,
+        checked and applied in one statement. Returns ``(previous_rating,
+        new_rating)``, or None if the rating was too low or there is no row.
+        """
+        stmt = (
+            update(RatingUsers)
+            .where(
+                RatingUsers.user_id == user_id,
+                RatingUsers.chat_id == chat_id,
+                RatingUsers.rating >= minimum,
+            )
+            .values(rating=RatingUsers.rating + change)
+            .returning(RatingUsers.rating - change, RatingUsers.rating)
+        )
+        async with self._writing(chat_id) as written:
+            result = await self.session.execute(stmt)
+            await self.session.commit()
+            changed = result.one_or_none()
+            if changed is not None:
+                written[chat_id, user_id] = change
+        return None if changed is None else tuple(changed)
 
     async def get_rating_by_user_id(self, user_id: int, chat_id: int) -> Optional[int]:
+        version = None
+        if self.redis is not None:
+            cached, *guard = await self.redis.mget(
+                [self._cache_key(user_id, chat_id), *self._guard_keys(chat_id)]
+            )
+            if cached is not None:
+                return int(cached) if cached else None
+            version = self._cache_version(*guard)
+
         stmt = select(RatingUsers.rating).where(RatingUsers.user_id == user_id, RatingUsers.chat_id == chat_id)
         result = await self.session.execute(stmt)
         rating = result.scalar()
         logging.info(f"Rating for user {user_id} in chat {chat_id}: {rating}")
+        await self._fill_cache(chat_id, version, {user_id: rating})
         return rating
 
-    async def wipe_ratings(self):
-        stmt = update(RatingUsers).values(rating=0)
-        await self.session.execute(stmt)
-        await self.session.commit()
-
-    async def update_rating_by_user_id(self, user_id: int, chat_id: int, rating: int):
+    async def get_ratings(self, chat_id: int, user_ids: Iterable[int]) -> dict[int, int]:
+        """
+        Ratings of several users in one chat, served by one MGET plus at most one
+        SELECT for the users that were not cached. Users without a rating row are
+        left out of the result.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        ratings: dict[int, int] = {}
+        missing = user_ids
+        version = None
+        if self.redis is not None and user_ids:
+            *cached, in_flight, chat_version = await self.redis.mget(
+                [self._cache_key(user_id, chat_id) for user_id in user_ids]
+                + self._guard_keys(chat_id)
+            )
+            version = self._cache_version(in_flight, chat_version)
+            missing = []
+            for user_id, value in zip(user_ids, cached):
+                if value is None:
+                    missing.append(user_id)
+                elif value:
+                    ratings[user_id] = int(value)
+
+        if missing:
+            stmt = select(RatingUsers.user_id, RatingUsers.rating).where(
+                RatingUsers.chat_id == chat_id, RatingUsers.user_id.in_(missing)
+            )
+            result = await self.session.execute(stmt)
+            found = {user_id: rating for user_id, rating in result.all()}
+            ratings.update(found)
+            await self._fill_cache(
+                chat_id, version, {user_id: found.get(user_id) for user_id in missing}
+            )
+        return ratings
+
+    async def wipe_ratings(self) -> Sequence[tuple[int, int, int]]:
+        """
+        Reset every rating to 0. Returns ``(chat_id, user_id, old_rating)`` of the
+        ratings that were not 0 already.
+        """
+        chat_ids = await self.get_bot_chats()
+        # In UPDATE ... FROM the joined copy still holds the pre-update values
+        previous = aliased(RatingUsers, name="previous")
         stmt = (
             update(RatingUsers)
-            .where(RatingUsers.user_id == user_id, RatingUsers.chat_id == chat_id)
+            .where(
+                previous.chat_id == RatingUsers.chat_id,
+                previous.user_id == RatingUsers.user_id,
+                RatingUsers.rating != 0,
+            )
+            .values(rating=0)
+            .returning(RatingUsers.chat_id, RatingUsers.user_id, previous.rating)
+        )
+        lock = select(RatingUsers.user_id).where(RatingUsers.rating != 0).with_for_update()
+        async with self._writing(*chat_ids):
+            await self.session.execute(lock)
+            result = await self.session.execute(stmt)
+            await self.session.commit()
+            wiped = result.all()
+            if self.redis is not None:
+                keys = [key async for key in self.redis.scan_iter(match="rating_cache:*")]
+                keys += [key async for key in self.redis.scan_iter(match="leaderboard:*")]
+                if keys:
+                    await self.redis.delete(*keys)
+        return wiped
+
+    async def update_rating_by_user_id(
+        self, user_id: int, chat_id: int, rating: int
+    ) -> Optional[int]:
+        """Set the user's rating. Returns the rating it replaced, or None if there is no row."""
+        previous = aliased(RatingUsers, name="previous")
+        stmt = (
+            update(RatingUsers)
+            .where(
+                RatingUsers.user_id == user_id,
+                RatingUsers.chat_id == chat_id,
+                previous.chat_id == RatingUsers.chat_id,
+                previous.user_id == RatingUsers.user_id,
+            )
             .values(rating=rating)
+            .returning(previous.rating)
         )
-        await self.session.execute(stmt)
-        await self.session.commit()
+        # The row is locked first, so ``previous`` reads its current value and
+        # the returned rating (and the leaderboard delta) is exact
+        lock = (
+            select(RatingUsers.user_id)
+            .where(RatingUsers.user_id == user_id, RatingUsers.chat_id == chat_id)
+            .with_for_update()
+        )
+        async with self._writing(chat_id) as written:
+            await self.session.execute(lock)
+            result = await self.session.execute(stmt)
+            await self.session.commit()
+            previous_rating = result.scalar()
+            if previous_rating is not None:
+                written[chat_id, user_id] = rating - previous_rating
+        return previous_rating
 
     async def get_top_by_rating(self, limit=10) -> Sequence[tuple[int, int]]:
         stmt = (
@@ -106,14 +490,170 @@ class RatingUsersRepo:
         return result.scalars().all()
 
     async def get_top_by_rating_for_chat(self, chat_id: int, limit: int = 50):
+        version = await self._get_cache_version(chat_id) if self.redis is not None else None
         stmt = select(RatingUsers.user_id, RatingUsers.rating).where(RatingUsers.chat_id == chat_id).order_by(RatingUsers.rating.desc()).limit(limit)
         result = await self.session.execute(stmt)
+        top = result.all()
+        # The most active users of the chat, so their next reads are cache hits
+        await self._fill_cache(chat_id, version, {user_id: rating for user_id, rating in top})
+        return top
+
+    async def get_top_by_rating_per_chat(self, limit: int = 50) -> Sequence[tuple[int, int, int]]:
+        """Top ``limit`` users of every chat as ``(chat_id, user_id, rating)``, in one query."""
+        ranked = select(
+            RatingUsers.chat_id,
+            RatingUsers.user_id,
+            RatingUsers.rating,
+            func.row_number()
+            .over(partition_by=RatingUsers.chat_id, order_by=RatingUsers.rating.desc())
+            .label("place"),
+        ).subquery()
+        stmt = select(ranked.c.chat_id, ranked.c.user_id, ranked.c.rating).where(
+            ranked.c.place <= limit
+        )
+        result = await self.session.execute(stmt)
         return result.all()
 
-    async def update_rating_by_user_id_for_chat(self, user_id: int, chat_id: int, new_rating: int):
-        stmt = update(RatingUsers).where(RatingUsers.user_id == user_id, RatingUsers.chat_id == chat_id).values(rating=new_rating)
+    async def apply_inflation(
+        self, users: Sequence[tuple[int, int]]
+    ) -> Sequence[tuple[int, int, int, int]]:
+        """
+        Take 3% (at least 1 point, never below 0) off the rating of every given
+        ``(chat_id, user_id)`` with a positive rating, in one UPDATE.
+        Returns ``(chat_id, user_id, old_rating, new_rating)`` of updated rows.
+        """
+        if not users:
+            return []
+        targets = values(
+            column("chat_id", BIGINT), column("user_id", BIGINT), name="targets"
+        ).data(list(users))
+        # In UPDATE ... FROM the joined copy still holds the pre-update values
+        previous = aliased(RatingUsers, name="previous")
+        deduction = func.greatest(RatingUsers.rating * 3 // 100, 1)
+        stmt = (
+            update(RatingUsers)
+            .where(
+                RatingUsers.chat_id == targets.c.chat_id,
+                RatingUsers.user_id == targets.c.user_id,
+                previous.chat_id == RatingUsers.chat_id,
+                previous.user_id == RatingUsers.user_id,
+                RatingUsers.rating > 0,
+            )
+            .values(rating=func.greatest(RatingUsers.rating - deduction, 0))
+            .returning(
+                RatingUsers.chat_id,
+                RatingUsers.user_id,
+                previous.rating,
+                RatingUsers.rating,
+            )
+        )
+        # Locking the rows first makes ``previous`` read their current values,
+        # so old/new (and the leaderboard deltas) are exact under concurrent writes
+        lock = (
+            select(RatingUsers.user_id)
+            .where(
+                RatingUsers.chat_id == targets.c.chat_id,
+                RatingUsers.user_id == targets.c.user_id,
+            )
+            .with_for_update(of=RatingUsers)
+        )
+        chat_ids = set(chat_id for chat_id, _ in users)
+        async with self._writing(*chat_ids) as written:
+            await self.session.execute(lock)
+            result = await self.session.execute(stmt)
+            await self.session.commit()
+            reduced = result.all()
+            for chat_id, user_id, old_rating, new_rating in reduced:
+                written[chat_id, user_id] = new_rating - old_rating
+        return reduced
+
+    async def update_rating_by_user_id_for_chat(
+        self, user_id: int, chat_id: int, new_rating: int
+    ) -> Optional[int]:
+        return await self.update_rating_by_user_id(user_id, chat_id, new_rating)
+
+
+class RatingEventsRepo:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_events(self, events: Sequence[dict], batch_size: int = 1000):
+        """Insert many rating events, ``batch_size`` rows per statement."""
+        if not events:
+            return
+        events = list(events)
+        for i in range(0, len(events), batch_size):
+            await self.session.execute(insert(RatingEvents).values(events[i : i + batch_size]))
+        await self.session.commit()
+
+    async def get_deltas(
+        self, chat_id: int, user_ids: Iterable[int], since: datetime.datetime
+    ) -> dict[int, int]:
+        """
+        Total rating change of each user since ``since``. Days that were already
+        compacted are counted from their snapshot as whole days.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        events = select(
+            RatingEvents.target_id.label("user_id"), RatingEvents.delta
+        ).where(
+            RatingEvents.chat_id == chat_id,
+            RatingEvents.target_id.in_(user_ids),
+            RatingEvents.created_at >= since,
+        )
+        snapshots = select(
+            RatingEventSnapshots.user_id, RatingEventSnapshots.delta
+        ).where(
+            RatingEventSnapshots.chat_id == chat_id,
+            RatingEventSnapshots.user_id.in_(user_ids),
+            RatingEventSnapshots.day >= since.date(),
+        )
+        changes = union_all(events, snapshots).subquery()
+        stmt = select(changes.c.user_id, func.sum(changes.c.delta)).group_by(
+            changes.c.user_id
+        )
+        result = await self.session.execute(stmt)
+        return {user_id: int(delta) for user_id, delta in result.all()}
+
+    async def compact(self, before: datetime.datetime) -> int:
+        """
+        Fold events older than ``before`` into per-day snapshots and delete them.
+        Returns the number of folded events.
+        """
+        day = func.date(func.timezone("UTC", RatingEvents.created_at))
+        grouped = (
+            select(
+                RatingEvents.chat_id,
+                RatingEvents.target_id,
+                day,
+                func.sum(RatingEvents.delta),
+                func.count(),
+            )
+            .where(RatingEvents.created_at < before)
+            .group_by(RatingEvents.chat_id, RatingEvents.target_id, day)
+        )
+        stmt = pg_insert(RatingEventSnapshots).from_select(
+            ["chat_id", "user_id", "day", "delta", "events"], grouped
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                RatingEventSnapshots.chat_id,
+                RatingEventSnapshots.user_id,
+                RatingEventSnapshots.day,
+            ],
+            set_={
+                "delta": RatingEventSnapshots.delta + stmt.excluded.delta,
+                "events": RatingEventSnapshots.events + stmt.excluded.events,
+            },
+        )
         await self.session.execute(stmt)
+        result = await self.session.execute(
+            delete(RatingEvents).where(RatingEvents.created_at < before)
+        )
         await self.session.commit()
+        return result.rowcount
 
 
 class MessageUserRepo:
@@ -129,6 +669,14 @@ class MessageUserRepo:
         await self.session.execute(stmt)
         await self.session.commit()
 
+    async def add_messages(self, messages: Sequence[dict]):
+        """Insert many (user_id, chat_id, message_id) rows in one statement."""
+        if not messages:
+            return
+        stmt = pg_insert(MessageUser).values(list(messages)).on_conflict_do_nothing()
+        await self.session.execute(stmt)
+        await self.session.commit()
+
     async def get_user_id_by_message_id(
         self, chat_id: int, message_id: int
     ) -> Optional[int]:
@@ -139,6 +687,138 @@ class MessageUserRepo:
         return result.scalar_one_or_none()
 
 
+class ChatMessagesRepo:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_messages(self, messages: Sequence[dict]):
+        """Insert many archived messages in one statement, skipping known ones."""
+        if not messages:
+            return
+        stmt = pg_insert(ChatMessages).values(list(messages)).on_conflict_do_nothing()
+        await self.session.execute(stmt)
+        await self.session.commit()
+
+    async def get_last_messages(
+        self, chat_id: int, limit: int, after_message_id: int = 0
+    ) -> List[ChatMessages]:
+        """The last ``limit`` messages newer than ``after_message_id``, oldest first."""
+        stmt = (
+            select(ChatMessages)
+            .where(
+                ChatMessages.chat_id == chat_id,
+                ChatMessages.message_id > after_message_id,
+            )
+            .order_by(ChatMessages.message_id.desc())
+            .limit(limit)
+        )
+        result = await self.session.scalars(stmt)
+        return list(reversed(result.all()))
+
+    async def is_archived_since(self, chat_id: int, message_id: int) -> bool:
+        """
+        Whether the chat was already being archived at ``message_id``, i.e. some
+        message at or before it is archived. Gaps after that are messages that
+        are never archived, like stickers and service messages.
+        """
+        stmt = select(
+            select(ChatMessages.message_id)
+            .where(ChatMessages.chat_id == chat_id, ChatMessages.message_id <= message_id)
+            .exists()
+        )
+        return bool(await self.session.scalar(stmt))
+
+    async def get_messages_range(
+        self, chat_id: int, from_message_id: int, to_message_id: int
+    ) -> List[ChatMessages]:
+        """Messages with ids in ``[from_message_id, to_message_id]``, oldest first."""
+        stmt = (
+            select(ChatMessages)
+            .where(
+                ChatMessages.chat_id == chat_id,
+                ChatMessages.message_id.between(from_message_id, to_message_id),
+            )
+            .order_by(ChatMessages.message_id)
+        )
+        result = await self.session.scalars(stmt)
+        return list(result.all())
+
+    async def get_reply_chain(
+        self, chat_id: int, message_id: int, max_length: int = 5
+    ) -> List[ChatMessages]:
+        """
+        The message and up to ``max_length - 1`` messages it replies to, resolved
+        with one recursive query. Oldest first; stops at the first hop that is not
+        archived.
+        """
+        chain = (
+            select(ChatMessages, literal(1).label("depth"))
+            .where(ChatMessages.chat_id == chat_id, ChatMessages.message_id == message_id)
+            .cte("reply_chain", recursive=True)
+        )
+        chain = chain.union_all(
+            select(ChatMessages, (chain.c.depth + 1).label("depth"))
+            .join(
+                chain,
+                and_(
+                    ChatMessages.chat_id == chain.c.chat_id,
+                    ChatMessages.message_id == chain.c.reply_to_id,
+                ),
+            )
+            .where(chain.c.depth < max_length)
+        )
+        message = aliased(ChatMessages, chain)
+        result = await self.session.scalars(select(message).order_by(chain.c.depth.desc()))
+        return list(result.all())
+
+    async def create_partition(self, month: datetime.date):
+        """
+        Create the partition holding the messages of the month starting at ``month``.
+
+        Messages of that month that already landed in the default partition are
+        moved into the new one, since Postgres refuses to add a partition whose
+        range overlaps rows in the default partition. Concurrent callers are
+        serialized by a transaction-level advisory lock.
+        """
+        month = month.replace(day=1)
+        next_month = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        partition = f"ChatMessages_{month:%Y_%m}"
+        await self.session.execute(
+            select(func.pg_advisory_xact_lock(func.hashtext("ChatMessages_partitions")))
+        )
+        exists = await self.session.scalar(
+            select(func.to_regclass(f'"{partition}"').is_not(None))
+        )
+        if exists:
+            await self.session.commit()
+            return
+
+        await self.session.execute(
+            text(
+                f'CREATE TABLE "{partition}" '
+                f'(LIKE "ChatMessages" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            )
+        )
+        moved = await self.session.execute(
+            text(
+                f'WITH moved AS ('
+                f'DELETE FROM "ChatMessages_default" '
+                f'WHERE date >= :month AND date < :next_month RETURNING *'
+                f') INSERT INTO "{partition}" SELECT * FROM moved'
+            ),
+            {"month": month, "next_month": next_month},
+        )
+        await self.session.execute(
+            text(
+                f'ALTER TABLE "ChatMessages" ATTACH PARTITION "{partition}" '
+                f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+            )
+        )
+        await self.session.commit()
+        if moved.rowcount:
+            logging.info(f"Moved {moved.rowcount} chat messages from the default partition to {partition}")
+
+
 @dataclass
 class RequestsRepo:
     """
@@ -148,6 +828,7 @@ class RequestsRepo:
     """
 
     session: AsyncSession
+    redis: Optional[Redis] = None
 
     @property
     def banned_stickers(self) -> BannedStickersRepo:
@@ -159,12 +840,20 @@ class RequestsRepo:
 
     @property
     def rating_users(self) -> RatingUsersRepo:
-        return RatingUsersRepo(self.session)
+        return RatingUsersRepo(self.session, self.redis)
+
+    @property
+    def rating_events(self) -> RatingEventsRepo:
+        return RatingEventsRepo(self.session)
 
     @property
     def message_user(self) -> MessageUserRepo:
         return MessageUserRepo(self.session)
 
+    @property
+    def chat_messages(self) -> ChatMessagesRepo:
+        return ChatMessagesRepo(self.session)
+
 
 # class Database:
 #     def __init__(self, engine):
@@ -4,11 +4,18 @@ from apscheduler.triggers.cron import CronTrigger
 from aiogram import Bot
 from aiogram.fsm.storage.redis import RedisStorage
 from sqlalchemy.ext.asyncio import async_sessionmaker
+from datetime import datetime, timedelta, timezone
 import time
 import logging
 
 from infrastructure.database.repo.requests import RequestsRepo
-from tgbot.services.cache_profiles import get_profile_cached
+from tgbot.services.activity import get_active_users_for_chats
+from tgbot.services.rating_events import (
+    RATING_EVENTS_RETENTION,
+    RatingEventSource,
+    rating_event,
+)
+from tgbot.services.cache_profiles import get_profiles_cached
 async def apply_rating_inflation(bot: Bot, session_pool: async_sessionmaker, storage: RedisStorage):
     logging.info("Починається завдання інфляції рейтингу")
     
@@ -16,40 +23,46 @@ async def apply_rating_inflation(bot: Bot, session_pool: async_sessionmaker, sto
     reduced_ratings = []
     
     async with session_pool() as session:
-        repo = RequestsRepo(session)
-        # Отримуємо всі чати, де є бот
-        bot_chats = await repo.rating_users.get_bot_chats() 
-        
-        for chat_id in bot_chats:
-            # Отримуємо топ користувачів для цього конкретного чату
-            top_users = await repo.rating_users.get_top_by_rating_for_chat(chat_id, 50) 
-            
-            chat_reduced_ratings = []
-            for user_id, current_rating in top_users:
-                # Перевіряємо, чи був користувач активним у цьому чаті за останній день
-                last_activity_key = f"user_activity:{chat_id}:{user_id}"
-                last_activity = await storage.redis.get(last_activity_key)
-                
-                if not last_activity or (current_time - int(last_activity)) >= 86400:  # 86400 секунд = 1 день
-                    # Застосовуємо інфляцію: знижуємо на 1% або мінімум на 1 пункт
-                    deduction = max(int(current_rating * 0.03), 1)
-                    new_rating = max(current_rating - deduction, 0)  # Переконуємося, що рейтинг не стане від'ємним
-                    
-                    await repo.rating_users.update_rating_by_user_id_for_chat(user_id, chat_id, new_rating)
-                    
-                    # Отримуємо інформацію про профіль користувача
-                    user_profile = await get_profile_cached(storage, chat_id, user_id, bot)
-                    
-                    if user_profile:
-                        chat_reduced_ratings.append((user_profile, current_rating, new_rating))
-                        logging.info(f"Застосовано інфляцію рейтингу для користувача {user_profile} в чаті {chat_id}. Старий рейтинг: {current_rating}, Новий рейтинг: {new_rating}")
-                    else:
-                        logging.info(f"Застосовано інфляцію рейтингу для користувача {user_id} в чаті {chat_id}. Старий рейтинг: {current_rating}, Новий рейтинг: {new_rating}. Не вдалося отримати профіль користувача.")
-                else:
-                    logging.info(f"Користувач {user_id} був активним у чаті {chat_id}. Інфляція не застосована. Поточний рейтинг: {current_rating}")
-            
-            if chat_reduced_ratings:
-                reduced_ratings.append((chat_id, chat_reduced_ratings))
+        repo = RequestsRepo(session, storage.redis)
+        # Топ-50 користувачів кожного чату одним запитом
+        top_users = await repo.rating_users.get_top_by_rating_per_chat(50)
+        bot_chats = list(dict.fromkeys(chat_id for chat_id, _, _ in top_users))
+        # Користувачі, активні у кожному чаті за останній день (86400 секунд)
+        active_users = await get_active_users_for_chats(storage.redis, bot_chats, current_time - 86400)
+
+        inactive_users = [
+            (chat_id, user_id)
+            for chat_id, user_id, _ in top_users
+            if user_id not in active_users[chat_id]
+        ]
+        logging.info(f"Неактивних користувачів у топах чатів: {len(inactive_users)} з {len(top_users)}")
+
+        # Знижуємо рейтинг на 3% (мінімум на 1 пункт) усім неактивним одним UPDATE
+        reduced = await repo.rating_users.apply_inflation(inactive_users)
+        await repo.rating_events.add_events(
+            [
+                rating_event(chat_id, user_id, new_rating - old_rating, RatingEventSource.INFLATION)
+                for chat_id, user_id, old_rating, new_rating in reduced
+            ]
+        )
+
+    reduced_by_chat: dict[int, list[tuple[int, int, int]]] = {}
+    for chat_id, user_id, old_rating, new_rating in reduced:
+        reduced_by_chat.setdefault(chat_id, []).append((user_id, old_rating, new_rating))
+
+    for chat_id, reduced_users in reduced_by_chat.items():
+        # Отримуємо профілі всіх користувачів зі зниженим рейтингом одним запитом
+        profiles = await get_profiles_cached(
+            storage, chat_id, [user_id for user_id, _, _ in reduced_users], bot
+        )
+        chat_reduced_ratings = [
+            (user_profile, old_rating, new_rating)
+            for (_, old_rating, new_rating), user_profile in zip(reduced_users, profiles)
+            if user_profile
+        ]
+        logging.info(f"Застосовано інфляцію рейтингу до {len(reduced_users)} користувачів у чаті {chat_id}")
+        if chat_reduced_ratings:
+            reduced_ratings.append((chat_id, chat_reduced_ratings))
 
     # Формуємо повідомлення
     message = hbold("📉 Щоденний звіт про інфляцію рейтингу 📉\n\n")
@@ -90,4 +103,48 @@ def setup_rating_inflation_task(scheduler: AsyncIOScheduler, bot: Bot, session_p
         replace_existing=True,
         # next_run_time=datetime.now() + timedelta(seconds=5),
     )
-    logging.info("Rating inflation task scheduled")
\ No newline at end of file
+    logging.info("Rating inflation task scheduled")
+
+
+async def compact_rating_events(session_pool: async_sessionmaker):
+    before = datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) - RATING_EVENTS_RETENTION
+    async with session_pool() as session:
+        repo = RequestsRepo(session)
+        folded = await repo.rating_events.compact(before)
+    logging.info(f"Compacted {folded} rating events older than {before.date()}")
+
+
+def setup_rating_events_compaction_task(scheduler: AsyncIOScheduler, session_pool: async_sessionmaker):
+    scheduler.add_job(
+        compact_rating_events,
+        trigger=CronTrigger(hour=4, minute=0),
+        args=[session_pool],
+        id='rating_events_compaction_task',
+        replace_existing=True,
+    )
+    logging.info("Rating events compaction task scheduled")
+
+
+async def create_chat_messages_partitions(session_pool: async_sessionmaker, months_ahead: int = 1):
+    month = datetime.now(timezone.utc).date().replace(day=1)
+    async with session_pool() as session:
+        repo = RequestsRepo(session)
+        for _ in range(months_ahead + 1):
+            await repo.chat_messages.create_partition(month)
+            month = (month + timedelta(days=32)).replace(day=1)
+    logging.info(f"ChatMessages partitions are ready until {month}")
+
+
+def setup_chat_messages_partitions_task(scheduler: AsyncIOScheduler, session_pool: async_sessionmaker):
+    # Runs daily, so the next month's partition exists well before it is needed
+    scheduler.add_job(
+        create_chat_messages_partitions,
+        trigger=CronTrigger(hour=3, minute=30),
+        args=[session_pool],
+        id='chat_messages_partitions_task',
+        replace_existing=True,
+        next_run_time=datetime.now(timezone.utc),
+    )
+    logging.info("ChatMessages partitions task scheduled")
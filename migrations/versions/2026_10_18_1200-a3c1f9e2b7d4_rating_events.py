@@ -0,0 +1,54 @@
+"""rating events
+
+Revision ID: a3c1f9e2b7d4
+Revises: 7809b689261f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c1f9e2b7d4'
+down_revision: Union[str, None] = '7809b689261f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'RatingEvents',
+        sa.Column('id', sa.BIGINT(), autoincrement=True, nullable=False),
+        sa.Column('chat_id', sa.BIGINT(), nullable=False),
+        sa.Column('target_id', sa.BIGINT(), nullable=False),
+        sa.Column('actor_id', sa.BIGINT(), nullable=True),
+        sa.Column('delta', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=32), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_RatingEvents_chat_target_created',
+        'RatingEvents',
+        ['chat_id', 'target_id', 'created_at'],
+    )
+    op.create_index('ix_RatingEvents_created_at', 'RatingEvents', ['created_at'])
+    op.create_table(
+        'RatingEventSnapshots',
+        sa.Column('chat_id', sa.BIGINT(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.BIGINT(), autoincrement=False, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('delta', sa.Integer(), nullable=False),
+        sa.Column('events', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('chat_id', 'user_id', 'day')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('RatingEventSnapshots')
+    op.drop_index('ix_RatingEvents_created_at', table_name='RatingEvents')
+    op.drop_index('ix_RatingEvents_chat_target_created', table_name='RatingEvents')
+    op.drop_table('RatingEvents')
@@ -0,0 +1,61 @@
+"""chat messages
+
+Revision ID: c7e4d2a9f1b3
+Revises: a3c1f9e2b7d4
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e4d2a9f1b3'
+down_revision: Union[str, None] = 'a3c1f9e2b7d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ChatMessages',
+        sa.Column('chat_id', sa.BIGINT(), autoincrement=False, nullable=False),
+        sa.Column('message_id', sa.BIGINT(), autoincrement=False, nullable=False),
+        sa.Column('date', postgresql.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('user_id', sa.BIGINT(), nullable=True),
+        sa.Column('user_name', sa.String(length=255), nullable=False),
+        sa.Column('username', sa.String(length=64), nullable=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('reply_to_id', sa.BIGINT(), nullable=True),
+        sa.Column('url', sa.String(length=255), nullable=True),
+        sa.Column('photo_file_id', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('chat_id', 'message_id', 'date'),
+        postgresql_partition_by='RANGE (date)',
+    )
+    op.create_index('ix_ChatMessages_chat_date', 'ChatMessages', ['chat_id', 'date'])
+
+    # Catches messages dated outside every month partition, so an insert never
+    # fails for want of a partition. The scheduler moves such rows out when it
+    # creates the partition for their month.
+    op.execute('CREATE TABLE "ChatMessages_default" PARTITION OF "ChatMessages" DEFAULT')
+
+    # Partitions for the current and the next UTC month; later ones are created
+    # by the scheduler
+    month = datetime.now(timezone.utc).date().replace(day=1)
+    for _ in range(2):
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        op.execute(
+            f'CREATE TABLE IF NOT EXISTS "ChatMessages_{month:%Y_%m}" '
+            f'PARTITION OF "ChatMessages" '
+            f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        )
+        month = next_month
+
+
+def downgrade() -> None:
+    # Dropping the parent drops all of its partitions
+    op.drop_index('ix_ChatMessages_chat_date', table_name='ChatMessages')
+    op.drop_table('ChatMessages')
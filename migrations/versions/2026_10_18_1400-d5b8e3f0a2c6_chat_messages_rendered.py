@@ -0,0 +1,28 @@
+"""chat messages rendered
+
+Revision ID: d5b8e3f0a2c6
+Revises: c7e4d2a9f1b3
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5b8e3f0a2c6'
+down_revision: Union[str, None] = 'c7e4d2a9f1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Columns added to the partitioned parent propagate to every partition
+    op.add_column('ChatMessages', sa.Column('rendered', sa.Text(), nullable=True))
+    op.add_column('ChatMessages', sa.Column('render_version', sa.SmallInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('ChatMessages', 'render_version')
+    op.drop_column('ChatMessages', 'rendered')
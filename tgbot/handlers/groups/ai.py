@@ -1,9 +1,5 @@
-from collections import deque
-from datetime import datetime
-import json
 import logging
 import random
-from zoneinfo import ZoneInfo
 from emoji import EMOJI_DATA
 import pycountry
 
@@ -21,6 +17,8 @@ from openai import AsyncOpenAI
 from elevenlabs.client import AsyncElevenLabs
 from pyrogram.client import Client
 
+from infrastructure.database.models.tables import ChatMessages
+from infrastructure.database.repo.requests import RequestsRepo
 from tgbot.filters.rating import RatingFilter
 from tgbot.misc.ai_prompts import (
     GOOD_MODE,
@@ -38,17 +36,25 @@ from tgbot.services.ai_service.anthropic_provider import (
     AnthropicProvider,
 )
 from tgbot.services.ai_service.history_analysis import (
+    HistorySummarizer,
     format_summary,
-    summarize_chat_history,
 )
 from tgbot.services.ai_service.openai_provider import OpenAIProvider
 from tgbot.services.ai_service.user_context import AIUserContextManager
+from tgbot.services.chat_archive import (
+    ChatMessageArchiver,
+    archived_message,
+    pyrogram_archived_message,
+    render_history_message,
+    render_row,
+    resolve_reply_chain,
+    to_history_message,
+)
+from tgbot.services.chat_history import CHAT_HISTORY_LIMIT, ChatHistoryStore
 from tgbot.services.payments import payment_keyboard
-from tgbot.services.token_usage import Sonnet
+from tgbot.services.token_usage import Sonnet, UsageSnapshot
 from pyrogram.types import Message as PyrogramMessage
-import pyrogram.errors
 
-from aiogram.utils.text_decorations import html_decoration as hd
 
 ai_router = Router()
 ai_router.message.filter(F.chat.id.in_({-1001415356906, 362089194}))
@@ -99,26 +105,8 @@ def parse_multiple_command(command: CommandObject | None) -> tuple[int, str]:
 
 def format_message(msg: Union[dict, PyrogramMessage]) -> str:
     if isinstance(msg, dict):
-        date = datetime.fromisoformat(msg["date"]).replace(tzinfo=ZoneInfo("UTC"))
-        kyiv_date = date.astimezone(ZoneInfo("Europe/Kiev"))
-        formatted_date = kyiv_date.strftime("%Y-%m-%d %H:%M")
-        return f"""<time>{formatted_date}</time><user>{msg['user']}</user>:<message>{msg['content']}</message><message_url>{msg['url']}</message_url>"""
-    else:
-        utc_date = msg.date.replace(tzinfo=ZoneInfo("UTC"))
-        kyiv_date = utc_date.astimezone(ZoneInfo("Europe/Kiev"))
-        formatted_date = kyiv_date.strftime("%Y-%m-d %H:%M")
-        user = (
-            f"{msg.from_user.first_name or ''} {msg.from_user.last_name or ''}"
-            if msg.from_user
-            else "unknown"
-        ).strip()
-        content = msg.text or msg.caption or ""
-        username = (
-            f"@{msg.from_user.username}"
-            if msg.from_user and msg.from_user.username
-            else ""
-        )
-        return f"""<time>{formatted_date}</time><user>{user} {username}</user>:<message>{content}</message><message_url>{msg.link}</message_url>"""
+        return render_history_message(msg)
+    return pyrogram_archived_message(msg)["rendered"]
 
 
 def should_include_message(msg: Union[dict, PyrogramMessage], with_bot: bool) -> bool:
@@ -148,23 +136,31 @@ async def summarize_and_update_history(
     message: types.Message,
     state: FSMContext,
     bot: Bot,
-    ai_client: AsyncOpenAI,
+    history_summarizer: HistorySummarizer,
+    chat_history: ChatHistoryStore,
+    repo: RequestsRepo,
     messages_to_summarize: list | None = None,
     with_bot: bool = True,
     notification: str = "",
 ) -> None:
     state_data = await state.get_data()
-    messages_history = state_data.get("messages_history", [])
     last_history_message_id = state_data.get("last_history_message_id", 0)
     last_summarized_id = state_data.get("last_summarized_id", 0)
 
+    # Both /history and the automatic summary read the archive first, so they
+    # render the same messages identically and share cached chunk summaries
+    archived = await repo.chat_messages.get_last_messages(
+        message.chat.id, CHAT_HISTORY_LIMIT, after_message_id=last_history_message_id
+    )
+    messages_history = [to_history_message(row) for row in archived]
+    if not messages_history:
+        messages_history = messages_to_summarize or await chat_history.get_messages(
+            message.chat.id
+        )
+
     if not messages_history:
         await message.answer("Немає історії повідомлень.")
         return
-    if not messages_to_summarize:
-        messages_history = json.loads(messages_history)
-    else:
-        messages_history = messages_to_summarize
 
     # Filter messages that were not covered in the previous history message
     if last_history_message_id:
@@ -197,15 +193,20 @@ async def summarize_and_update_history(
     new_last_history_message_id = max(msg["message_id"] for msg in messages_history)
     await state.update_data(last_history_message_id=new_last_history_message_id)
 
-    formatted_history = format_messages_history(messages_history, with_bot=with_bot)
+    # Rendered without the caller's filters; with_bot is applied when merging
+    history_lines = [
+        (msg["message_id"], format_message(msg))
+        for msg in messages_history
+        if msg["content"]
+    ]
 
     sent_message = await message.answer(text="⏳ Аналізую історію повідомлень...")
 
     try:
-        response = await summarize_chat_history(
-            chat_history=formatted_history,
-            client=ai_client,
+        response = await history_summarizer.summarize(
+            history_lines,
             num_topics=len(messages_history) // 40,
+            with_bot=with_bot,
         )
         if response:
             text = (
@@ -240,86 +241,91 @@ async def get_pyrogram_messages_history(
     start_message_id: int,
     chat_id: int,
     num_messages: int | None = None,
-    chained_replies: bool = False,
     with_bot: bool = True,
 ) -> tuple[str, list[str]]:
-    if not num_messages and not chained_replies:
+    if not num_messages:
         return "", []
 
     messages: list[PyrogramMessage] = []
-    if chained_replies:
-        try:
-            current_message_id = start_message_id
-            while (
-                current_message_id and len(messages) < 5
-            ):  # Limit to 5 chained messages
-                message: PyrogramMessage = await client.get_messages(
-                    chat_id=chat_id, message_ids=[current_message_id]
-                )
-                if message:
-                    if isinstance(message, list):
-                        message = message[0]
-                    messages.append(message)
-
-                    current_message_id = message.reply_to_message_id
-                else:
-                    break
-        except pyrogram.errors.exceptions.bad_request_400.MessageIdsEmpty:
-            return "", []
-
-    elif num_messages:
-        from_id = min(
-            start_message_id,
-            start_message_id + num_messages,
-        )
-        to_id = max(
-            start_message_id,
-            start_message_id + num_messages,
-        )
-        message_ids = [message_id for message_id in range(from_id, to_id)]
-        logging.info(
-            f"Getting messages {chat_id=}   from {from_id} to {to_id}, total {to_id - from_id} messages"
+    from_id = min(
+        start_message_id,
+        start_message_id + num_messages,
+    )
+    to_id = max(
+        start_message_id,
+        start_message_id + num_messages,
+    )
+    message_ids = [message_id for message_id in range(from_id, to_id)]
+    logging.info(
+        f"Getting messages {chat_id=}   from {from_id} to {to_id}, total {to_id - from_id} messages"
+    )
+    for i in range(0, len(message_ids), 200):
+        batch_message_ids = message_ids[i : i + 200]
+        batch_messages = await client.get_messages(
+            chat_id=chat_id, message_ids=batch_message_ids
         )
-        for i in range(0, len(message_ids), 200):
-            batch_message_ids = message_ids[i : i + 200]
-            batch_messages = await client.get_messages(
-                chat_id=chat_id, message_ids=batch_message_ids
-            )
-            if isinstance(batch_messages, PyrogramMessage):
-                messages.append(batch_messages)
+        if isinstance(batch_messages, PyrogramMessage):
+            messages.append(batch_messages)
 
-            elif isinstance(batch_messages, list):
-                messages.extend(batch_messages)
+        elif isinstance(batch_messages, list):
+            messages.extend(batch_messages)
 
     logging.info(f"Got {len(messages)} messages history")
 
     formatted_messages = []
     photo_file_ids = []
     for msg in messages:
-        utc_date = msg.date.replace(tzinfo=ZoneInfo("UTC"))
-        kyiv_date = utc_date.astimezone(ZoneInfo("Europe/Kiev"))
-        formatted_date = kyiv_date.strftime("%Y-%m-d %H:%M")
-        user = (
-            f"{msg.from_user.first_name or ''} {msg.from_user.last_name or ''}"
-            if msg.from_user
-            else "unknown"
-        ).strip()
-        content = msg.text or msg.caption or ""
-        username = (
-            f"@{msg.from_user.username}"
-            if msg.from_user and msg.from_user.username
-            else ""
-        )
+        row = pyrogram_archived_message(msg)
+        if row["photo_file_id"]:
+            photo_file_ids.append(row["photo_file_id"])
+        formatted_messages.append(row["rendered"])
 
-        if msg.photo:
-            photo_file_ids.append(msg.photo.file_id)
+    return "\n".join(formatted_messages), photo_file_ids
 
-        formatted_message = f"""<time>{formatted_date}</time><user>{user} {username}</user>:<message>{content}</message><message_url>{msg.link}</message_url>"""
-        formatted_messages.append(formatted_message)
 
+def format_archived_messages(messages: list[ChatMessages]) -> tuple[str, list[str]]:
+    formatted_messages = [render_row(msg) for msg in messages]
+    photo_file_ids = [msg.photo_file_id for msg in messages if msg.photo_file_id]
     return "\n".join(formatted_messages), photo_file_ids
 
 
+async def get_archived_messages_history(
+    repo: RequestsRepo,
+    client: Client,
+    chat_archiver: ChatMessageArchiver,
+    start_message_id: int,
+    chat_id: int,
+    num_messages: int,
+) -> tuple[str, list[str]]:
+    """
+    Messages between ``start_message_id`` and ``start_message_id + num_messages``
+    from the archive, including those still buffered by the archiver. Falls back
+    to MTProto when the range starts before the archive does.
+    """
+    from_id = min(start_message_id, start_message_id + num_messages)
+    to_id = max(start_message_id, start_message_id + num_messages)
+    archived = {
+        msg.message_id: msg
+        for msg in await repo.chat_messages.get_messages_range(chat_id, from_id, to_id - 1)
+    }
+    for message_id in range(from_id, to_id):
+        row = chat_archiver.get((chat_id, message_id))
+        if row is not None and message_id not in archived:
+            archived[message_id] = ChatMessages(**row)
+    messages = [archived[message_id] for message_id in sorted(archived)]
+
+    # The first requested ids are often stickers or service messages, which are
+    # never archived, so coverage is decided by when archiving started
+    covered = bool(messages) and messages[0].message_id <= from_id
+    if not covered and not await repo.chat_messages.is_archived_since(chat_id, from_id):
+        return await get_pyrogram_messages_history(
+            client, start_message_id, chat_id, num_messages
+        )
+
+    logging.info(f"Got {len(messages)} messages history from the archive")
+    return format_archived_messages(messages)
+
+
 async def get_initial_messages(
     client: Client, chat_id: int, message_id: int
 ) -> list[dict]:
@@ -338,55 +344,29 @@ async def get_initial_messages(
             continue
 
         messages.append(
-            {
-                "date": msg.date.isoformat(),
-                "user": hd.quote(
-                    msg.from_user.first_name if msg.from_user else "Unknown"
-                ),
-                "content": hd.quote(msg.text or msg.caption or ""),
-                "url": msg.link,
-                "reply_to_id": msg.reply_to_message.id
-                if msg.reply_to_message
-                else None,
-                "message_id": msg.id,
-            }
+            to_history_message(ChatMessages(**pyrogram_archived_message(msg)))
         )
     return list(reversed(messages))  # Reverse to get chronological order
 
 
 async def get_messages_history(
-    state: FSMContext,
+    chat_history: ChatHistoryStore,
+    chat_id: int,
     start_message_id: int,
     num_messages: Optional[int] = None,
     limit: int = 2048,
     chained_replies: bool = False,
     with_bot: bool = True,
 ) -> str:
-    state_data = await state.get_data()
-    messages_history = state_data.get("messages_history", None)
-
-    if not messages_history:
-        return ""
-
-    messages_history = deque(json.loads(messages_history), maxlen=400)
-
     if chained_replies:
         # Find the message with start_message_id and its reply chain
-        chain = []
-        for msg in reversed(messages_history):
-            if msg["message_id"] == start_message_id or (
-                chain and msg["message_id"] == chain[-1]["reply_to_id"]
-            ):
-                chain.append(msg)
-
-            if len(chain) >= 4:
-                break
-
-        formatted_messages = list(reversed(chain))
+        formatted_messages = await chat_history.get_reply_chain(
+            chat_id, start_message_id
+        )
 
     elif num_messages:
         # Get the last num_messages
-        formatted_messages = list(messages_history)[-num_messages:]
+        formatted_messages = await chat_history.get_messages(chat_id, num_messages)
 
     else:
         return ""
@@ -394,7 +374,7 @@ async def get_messages_history(
     # Format messages
     formatted_history = "\n".join(
         [
-            f"<time>{msg['date']}</time><user>{msg['user']}</user>:<message>{msg['content']}</message><message_url>{msg['url']}</message_url>"
+            render_history_message(msg)
             for msg in formatted_messages
             if with_bot or (not with_bot and not msg["user"].endswith("(assistant)"))
         ]
@@ -505,10 +485,19 @@ async def command_summarize_chat_history(
     message: types.Message,
     state: FSMContext,
     bot: Bot,
-    openai_client: AsyncOpenAI,
+    history_summarizer: HistorySummarizer,
+    chat_history: ChatHistoryStore,
+    repo: RequestsRepo,
 ):
     await summarize_and_update_history(
-        message, state, bot, openai_client, with_bot=True, notification="#history"
+        message,
+        state,
+        bot,
+        history_summarizer,
+        chat_history,
+        repo,
+        with_bot=True,
+        notification="#history",
     )
 
 
@@ -544,12 +533,15 @@ async def ask_ai(
     state: FSMContext,
     client: Client,
     elevenlabs_client: AsyncElevenLabs,
+    repo: RequestsRepo,
+    chat_archiver: ChatMessageArchiver,
     rating: int = 400,
     prompt: str | None = None,
     command: CommandObject | None = None,
     photo: types.PhotoSize | None = None,
     assistant_message: str | None = None,
     user_needs_to_pay: bool = False,
+    usage_snapshot: UsageSnapshot | None = None,
 ):
     if message.quote:
         return
@@ -597,16 +589,23 @@ async def ask_ai(
         prompt = multiple_prompt
 
     if num_messages:
-        messages_history, photo_file_ids = await get_pyrogram_messages_history(
-            client, message.reply_to_message.message_id, message.chat.id, num_messages
+        messages_history, photo_file_ids = await get_archived_messages_history(
+            repo,
+            client,
+            chat_archiver,
+            message.reply_to_message.message_id,
+            message.chat.id,
+            num_messages,
         )
     elif reply_prompt:
-        messages_history, photo_file_ids = await get_pyrogram_messages_history(
+        reply_chain = await resolve_reply_chain(
+            repo,
             client,
-            message.reply_to_message.message_id,
+            chat_archiver,
             message.chat.id,
-            chained_replies=True,
+            message.reply_to_message.message_id,
         )
+        messages_history, photo_file_ids = format_archived_messages(reply_chain)
     else:
         messages_history = ""
         photo_file_ids = []
@@ -661,9 +660,10 @@ async def ask_ai(
         ai_media = ai_provider.media_class(photo_bytes_io)
         ai_conversation.add_user_message(text="Image from history", ai_media=ai_media)
 
-    usage_cost = await ai_conversation.calculate_cost(
-        Sonnet, message.chat.id, message.from_user.id
-    )
+    if usage_snapshot is None:
+        usage_snapshot = await ai_conversation.get_snapshot(
+            message.chat.id, message.from_user.id
+        )
 
     sent_message = await message.answer(
         "⏳",
@@ -726,7 +726,9 @@ async def ask_ai(
 
     try:
         if user_needs_to_pay:
-            keyboard = await payment_keyboard(bot, usage_cost, message.chat.id)
+            keyboard = await payment_keyboard(
+                bot, state.storage.redis, message.chat.id
+            )
         else:
             keyboard = None
 
@@ -740,9 +742,7 @@ async def ask_ai(
         if not response:
             return
 
-        await ai_conversation.update_usage(
-            message.chat.id,
-            message.from_user.id,
+        await usage_snapshot.update_usage(
             response.usage,
             ai_conversation.max_tokens * 0.75,
         )
@@ -791,6 +791,7 @@ async def determine_nationality(
     anthropic_client: AsyncAnthropic,
     bot: Bot,
     state: FSMContext,
+    usage_snapshot: UsageSnapshot | None = None,
 ):
     # Get all the two-character language codes
     language_codes = [
@@ -825,12 +826,16 @@ async def determine_nationality(
     )
     ai_conversation.add_user_message(text="/nation")
 
-    usage_cost = await ai_conversation.calculate_cost(
-        Sonnet, message.chat.id, message.from_user.id
-    )
+    if usage_snapshot is None:
+        usage_snapshot = await ai_conversation.get_snapshot(
+            message.chat.id, message.from_user.id
+        )
+    usage_cost = usage_snapshot.calculate_cost(Sonnet)
     try:
         if usage_cost > 2:
-            keyboard = await payment_keyboard(bot, usage_cost, message.chat.id)
+            keyboard = await payment_keyboard(
+                bot, state.storage.redis, message.chat.id
+            )
         else:
             keyboard = None
 
@@ -845,9 +850,7 @@ async def determine_nationality(
         if not response:
             return
 
-        await ai_conversation.update_usage(
-            message.chat.id,
-            message.from_user.id,
+        await usage_snapshot.update_usage(
             response.usage,
             ai_conversation.max_tokens * 0.75,
         )
@@ -879,6 +882,7 @@ async def taro_reading(
     bot: Bot,
     state: FSMContext,
     command: CommandObject | None = None,
+    usage_snapshot: UsageSnapshot | None = None,
 ):
     ai_provider = AnthropicProvider(
         client=anthropic_client,
@@ -909,12 +913,16 @@ async def taro_reading(
     )
 
     ai_conversation.add_user_message(text=f"/taro {question}")
-    usage_cost = await ai_conversation.calculate_cost(
-        Sonnet, message.chat.id, message.from_user.id
-    )
+    if usage_snapshot is None:
+        usage_snapshot = await ai_conversation.get_snapshot(
+            message.chat.id, message.from_user.id
+        )
+    usage_cost = usage_snapshot.calculate_cost(Sonnet)
     try:
         if usage_cost > 2:
-            keyboard = await payment_keyboard(bot, usage_cost, message.chat.id)
+            keyboard = await payment_keyboard(
+                bot, state.storage.redis, message.chat.id
+            )
         else:
             keyboard = None
         response = await ai_conversation.answer_with_ai(
@@ -927,9 +935,7 @@ async def taro_reading(
         )
         if not response:
             return
-        await ai_conversation.update_usage(
-            message.chat.id,
-            message.from_user.id,
+        await usage_snapshot.update_usage(
             response.usage,
             ai_conversation.max_tokens * 0.75,
         )
@@ -949,6 +955,7 @@ async def determine_orientation(
     anthropic_client: AsyncAnthropic,
     bot: Bot,
     state: FSMContext,
+    usage_snapshot: UsageSnapshot | None = None,
 ):
     ai_provider = AnthropicProvider(
         client=anthropic_client,
@@ -975,12 +982,16 @@ async def determine_orientation(
     )
     ai_conversation.add_user_message(text="/identity")
 
-    usage_cost = await ai_conversation.calculate_cost(
-        Sonnet, message.chat.id, message.from_user.id
-    )
+    if usage_snapshot is None:
+        usage_snapshot = await ai_conversation.get_snapshot(
+            message.chat.id, message.from_user.id
+        )
+    usage_cost = usage_snapshot.calculate_cost(Sonnet)
     try:
         if usage_cost > 2:
-            keyboard = await payment_keyboard(bot, usage_cost, message.chat.id)
+            keyboard = await payment_keyboard(
+                bot, state.storage.redis, message.chat.id
+            )
         else:
             keyboard = None
 
@@ -995,9 +1006,7 @@ async def determine_orientation(
         if not response:
             return
 
-        await ai_conversation.update_usage(
-            message.chat.id,
-            message.from_user.id,
+        await usage_snapshot.update_usage(
             response.usage,
             ai_conversation.max_tokens * 0.75,
         )
@@ -1029,56 +1038,49 @@ async def history_worker(
     client: Client,
     bot: Bot,
     openai_client: AsyncOpenAI,
+    history_summarizer: HistorySummarizer,
+    chat_history: ChatHistoryStore,
+    repo: RequestsRepo,
 ):
     state_data = await state.get_data()
     ai_mode = state_data.get("ai_mode")
     last_summarized_id = state_data.get("last_summarized_id", 0)
-    messages_history = state_data.get("messages_history", None)
     last_history_message_id = state_data.get("last_history_message_id", 0)
 
-    if not messages_history:
-        initial_messages = await get_initial_messages(
-            client, message.chat.id, message.message_id
-        )
-        messages_history = deque(initial_messages, maxlen=400)
-    else:
-        messages_history = deque(json.loads(messages_history), maxlen=400)
-
-    new_message = {
-        "date": message.date.isoformat(),
-        "user": (
-            hd.quote(message.forward_from_chat.full_name)
-            if message.forward_from_chat
-            else hd.quote(message.from_user.full_name)
-        ),
-        "content": hd.quote(message.text or message.caption or ""),
-        "url": message.get_url(),
-        "reply_to_id": message.reply_to_message.message_id
-        if message.reply_to_message
-        else None,
-        "message_id": message.message_id,
-    }
+    new_message = to_history_message(ChatMessages(**archived_message(message)))
+    needs_seed = not await chat_history.exists(message.chat.id)
+    await chat_history.append(message.chat.id, new_message)
 
-    messages_history.append(new_message)
-    await state.update_data(messages_history=json.dumps(list(messages_history)))
+    if needs_seed and await chat_history.claim_seed(message.chat.id):
+        archived = await repo.chat_messages.get_last_messages(message.chat.id, 200)
+        initial_messages = [
+            to_history_message(row)
+            for row in archived
+            if row.content and row.message_id < message.message_id
+        ]
+        if not initial_messages:
+            initial_messages = await get_initial_messages(
+                client, message.chat.id, message.message_id
+            )
+        await chat_history.seed(message.chat.id, initial_messages)
 
     if ai_mode == "OFF":
         return
 
     if message.message_id - last_summarized_id >= 400:
         # Filter messages that were not covered in the previous history message
-        messages_to_summarize = [
-            msg
-            for msg in messages_history
-            if msg["message_id"] > last_history_message_id
-        ]
+        messages_to_summarize = await chat_history.get_messages_after(
+            message.chat.id, last_history_message_id
+        )
 
         if len(messages_to_summarize) >= 300:
             await summarize_and_update_history(
                 message,
                 state,
                 bot,
-                openai_client,
+                history_summarizer,
+                chat_history,
+                repo,
                 with_bot=False,
                 messages_to_summarize=messages_to_summarize,
             )
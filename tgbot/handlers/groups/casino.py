@@ -1,11 +1,11 @@
-import asyncio
-
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, User
 
 from infrastructure.database.repo.requests import RequestsRepo
 from tgbot.services.broadcaster import send_message
+from tgbot.services.message_deleter import MessageDeleter
+from tgbot.services.rating_events import RatingEventRecorder, RatingEventSource
 
 groups_casino_router = Router()
 
@@ -17,6 +17,8 @@ MAX_CASINO_BET = 7
 async def process_dice_roll(
     message: types.Message,
     repo: RequestsRepo,
+    rating_events: RatingEventRecorder,
+    message_deleter: MessageDeleter,
     user: User | None = None,
     rating_bet: int = 1,
 ):
@@ -49,9 +51,14 @@ async def process_dice_roll(
     # )
 
     if dice_value not in slots:
-        await repo.rating_users.increment_rating_by_user_id(user.id, -rating_bet)
-        await asyncio.sleep(6)
-        await message.delete()
+        new_rating = await repo.rating_users.increment_rating_by_user_id(
+            user.id, message.chat.id, -rating_bet
+        )
+        if new_rating is not None:
+            rating_events.record(
+                message.chat.id, user.id, -rating_bet, RatingEventSource.CASINO
+            )
+        await message_deleter.schedule(message.chat.id, [message.message_id], delay=6)
 
         return  # Exit if not a recognized dice value and not from a dice roll
 
@@ -68,8 +75,12 @@ async def process_dice_roll(
 
     added_rating = rating_bet * coefficient
     new_rating = await repo.rating_users.increment_rating_by_user_id(
-        user.id, added_rating
+        user.id, message.chat.id, added_rating
     )
+    if new_rating is not None:
+        rating_events.record(
+            message.chat.id, user.id, added_rating, RatingEventSource.CASINO
+        )
 
     success_message = f"Користувач {user.full_name} вибив {prize} і отримав {added_rating} рейтингу, тепер у нього {new_rating} рейтингу.\nВітаємо!"
     # await message.answer(success_message)
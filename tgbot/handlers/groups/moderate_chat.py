@@ -1,4 +1,3 @@
-import asyncio
 import datetime
 import logging
 import re
@@ -9,6 +8,7 @@ from aiogram.filters import Command
 from infrastructure.database.repo.requests import RequestsRepo
 from tgbot.filters.permissions import HasPermissionsFilter
 from tgbot.filters.rating import RatingFilter
+from tgbot.services.message_deleter import MessageDeleter
 from tgbot.misc.permissions import (
     set_new_user_approved_permissions,
     set_no_media_permissions,
@@ -50,7 +50,9 @@ def get_restriction_period(text: str) -> int:
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def read_only_mode(message: types.Message, bot: Bot):
+async def read_only_mode(
+    message: types.Message, bot: Bot, message_deleter: MessageDeleter
+):
     """Хендлер с фильтром в группе, где можно использовать команду !ro ИЛИ /ro"""
 
     # Создаем переменные для удобства
@@ -163,11 +165,16 @@ async def read_only_mode(message: types.Message, bot: Bot):
         logging.info(f"Бот не смог замутить пользователя @{member_username}")
     service_message = await message.answer("Повідомлення самознищиться за 5 секунд.")
 
-    await asyncio.sleep(5)
-    # после прошедших 5 секунд, бот удаляет сообщение от администратора и от самого бота
-    await message.delete()
-    await service_message.delete()
-    await message.reply_to_message.delete()
+    # через 5 секунд бот удалит сообщение от администратора и от самого бота
+    await message_deleter.schedule(
+        message.chat.id,
+        [
+            message.message_id,
+            service_message.message_id,
+            message.reply_to_message.message_id,
+        ],
+        delay=5,
+    )
 
 
 @groups_moderate_router.message(
@@ -175,7 +182,9 @@ async def read_only_mode(message: types.Message, bot: Bot):
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def undo_read_only_mode(message: types.Message, bot: Bot):
+async def undo_read_only_mode(
+    message: types.Message, bot: Bot, message_deleter: MessageDeleter
+):
     """Хендлер с фильтром в группе, где можно использовать команду !unro ИЛИ /unro"""
     (
         admin_username,
@@ -206,12 +215,10 @@ async def undo_read_only_mode(message: types.Message, bot: Bot):
         f"Пользователь @{member_username} был размучен администратором @{admin_username}"
     )
 
-    # Пауза 5 сек
-    await asyncio.sleep(5)
-
-    # Удаляем сообщения от бота и администратора
-    await message.delete()
-    await service_message.delete()
+    # Удаляем сообщения от бота и администратора через 5 сек
+    await message_deleter.schedule(
+        message.chat.id, [message.message_id, service_message.message_id], delay=5
+    )
 
 
 @groups_moderate_router.message(
@@ -220,7 +227,7 @@ async def undo_read_only_mode(message: types.Message, bot: Bot):
     HasPermissionsFilter(can_restrict_members=True),
     F.reply_to_message.sender_chat,
 )
-async def ban_channel(message: types.Message):
+async def ban_channel(message: types.Message, message_deleter: MessageDeleter):
     from_user = message.from_user
     sender_chat = message.reply_to_message.sender_chat
 
@@ -247,11 +254,15 @@ async def ban_channel(message: types.Message):
     # service_message = await message.answer("Сообщение самоуничтожится через 5 секунд.")
     service_message = await message.answer("Повідомлення самознищиться за 5 секунд.")
 
-    await asyncio.sleep(5)
-
-    await message.reply_to_message.delete()
-    await message.delete()
-    await service_message.delete()
+    await message_deleter.schedule(
+        message.chat.id,
+        [
+            message.reply_to_message.message_id,
+            message.message_id,
+            service_message.message_id,
+        ],
+        delay=5,
+    )
 
 
 @groups_moderate_router.message(
@@ -259,7 +270,7 @@ async def ban_channel(message: types.Message):
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def ban_user(message: types.Message):
+async def ban_user(message: types.Message, message_deleter: MessageDeleter):
     """Хендлер с фильтром в группе, где можно использовать команду !ban ИЛИ /ban"""
 
     # Создаем переменные для удобства
@@ -291,12 +302,16 @@ async def ban_user(message: types.Message):
     # service_message = await message.answer("Сообщение самоуничтожится через 5 секунд.")
     service_message = await message.answer("Повідомлення самознищиться за 5 секунд.")
 
-    # После чего засыпаем на 5 секунд
-    await asyncio.sleep(5)
-    # Не забываем удалить сообщение, на которое ссылался администратор
-    await message.reply_to_message.delete()
-    await message.delete()
-    await service_message.delete()
+    # Через 5 секунд удаляем сообщения, не забывая про сообщение, на которое ссылался администратор
+    await message_deleter.schedule(
+        message.chat.id,
+        [
+            message.reply_to_message.message_id,
+            message.message_id,
+            service_message.message_id,
+        ],
+        delay=5,
+    )
 
 
 @groups_moderate_router.message(
@@ -304,7 +319,7 @@ async def ban_user(message: types.Message):
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def unban_channel(message: types.Message):
+async def unban_channel(message: types.Message, message_deleter: MessageDeleter):
     from_user = message.from_user
     sender_chat = message.reply_to_message.sender_chat
 
@@ -331,10 +346,9 @@ async def unban_channel(message: types.Message):
 
     logging.info(f"Канал @{member_username} был забанен админом @{admin_username}")
 
-    await asyncio.sleep(5)
-
-    await message.delete()
-    await service_message.delete()
+    await message_deleter.schedule(
+        message.chat.id, [message.message_id, service_message.message_id], delay=5
+    )
 
 
 @groups_moderate_router.message(
@@ -342,7 +356,7 @@ async def unban_channel(message: types.Message):
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def unban_user(message: types.Message):
+async def unban_user(message: types.Message, message_deleter: MessageDeleter):
     """Хендлер с фильтром в группе, где можно использовать команду !unban ИЛИ /unban"""
 
     # Создаем переменные для удобства
@@ -363,17 +377,15 @@ async def unban_user(message: types.Message):
     # service_message = await message.reply("Сообщение самоуничтожится через 5 секунд.")
     service_message = await message.reply("Повідомлення самознищиться за 5 секунд.")
 
-    # Пауза 5 сек
-    await asyncio.sleep(5)
-
     # Записываем в логи
     logging.info(
         f"Пользователь @{member_username} был забанен админом @{admin_username}"
     )
 
-    # Удаляем сообщения
-    await message.delete()
-    await service_message.delete()
+    # Удаляем сообщения через 5 сек
+    await message_deleter.schedule(
+        message.chat.id, [message.message_id, service_message.message_id], delay=5
+    )
 
 
 @groups_moderate_router.message(
@@ -381,7 +393,9 @@ async def unban_user(message: types.Message):
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def media_false_handler(message: types.Message):
+async def media_false_handler(
+    message: types.Message, message_deleter: MessageDeleter
+):
     (
         admin_username,
         admin_mentioned,
@@ -435,10 +449,15 @@ async def media_false_handler(message: types.Message):
     # Отправляем сообщение
     await message.answer(text=answer_text)
     service_message = await message.reply("Сообщение самоуничтожится через 5 секунд")
-    await asyncio.sleep(5)
-    await message.reply_to_message.delete()
-    await message.delete()
-    await service_message.delete()
+    await message_deleter.schedule(
+        message.chat.id,
+        [
+            message.reply_to_message.message_id,
+            message.message_id,
+            service_message.message_id,
+        ],
+        delay=5,
+    )
 
 
 @groups_moderate_router.message(
@@ -446,7 +465,9 @@ async def media_false_handler(message: types.Message):
     F.reply_to_message,
     HasPermissionsFilter(can_restrict_members=True),
 )
-async def media_true_handler(message: types.Message, bot: Bot):
+async def media_true_handler(
+    message: types.Message, bot: Bot, message_deleter: MessageDeleter
+):
     (
         admin_username,
         admin_mentioned,
@@ -485,10 +506,15 @@ async def media_true_handler(message: types.Message, bot: Bot):
         logging.error(f"Бот не смог вернуть права пользователю @{member_username}")
 
     service_message = await message.reply("Сообщение самоуничтожится через 5 секунд.")
-    await asyncio.sleep(5)
-    await message.delete()
-    await service_message.delete()
-    await message.reply_to_message.delete()
+    await message_deleter.schedule(
+        message.chat.id,
+        [
+            message.message_id,
+            service_message.message_id,
+            message.reply_to_message.message_id,
+        ],
+        delay=5,
+    )
 
 
 # handler to promote and demoate users with optional arg for their custom title
@@ -497,7 +523,9 @@ async def media_true_handler(message: types.Message, bot: Bot):
     F.reply_to_message,
     HasPermissionsFilter(can_promote_members=True),
 )
-async def promote_user(message: types.Message, bot: Bot):
+async def promote_user(
+    message: types.Message, bot: Bot, message_deleter: MessageDeleter
+):
     admin_username = message.from_user.username
     admin_mentioned = message.from_user.mention_html()
     member_id = message.reply_to_message.from_user.id
@@ -538,9 +566,9 @@ async def promote_user(message: types.Message, bot: Bot):
         service_message = await message.reply(
             "Повідомлення самознищиться через 5 секунд."
         )
-        await asyncio.sleep(5)
-        await message.delete()
-        await service_message.delete()
+        await message_deleter.schedule(
+            message.chat.id, [message.message_id, service_message.message_id], delay=5
+        )
 
 
 @groups_moderate_router.message(
@@ -569,6 +597,7 @@ async def promote_with_title(
     message: types.Message,
     bot: Bot,
     repo: RequestsRepo,
+    message_deleter: MessageDeleter,
     member: types.User | None = None,
     member_self: types.User | None = None,
     rating: int | None = None,
@@ -641,9 +670,9 @@ async def promote_with_title(
         service_message = await message.reply(
             "Повідомлення самознищиться через 5 секунд."
         )
-        await asyncio.sleep(5)
-        await message.delete()
-        await service_message.delete()
+        await message_deleter.schedule(
+            message.chat.id, [message.message_id, service_message.message_id], delay=5
+        )
 
 
 @groups_moderate_router.message(
@@ -661,7 +690,7 @@ async def not_enough_rating(message: types.Message):
     F.reply_to_message,
     HasPermissionsFilter(can_promote_members=True),
 )
-async def demote_user(message: types.Message):
+async def demote_user(message: types.Message, message_deleter: MessageDeleter):
     admin_username = message.from_user.username
     admin_mentioned = message.from_user.mention_html()
     member_id = message.reply_to_message.from_user.id
@@ -693,9 +722,9 @@ async def demote_user(message: types.Message):
         service_message = await message.reply(
             "Повідомлення самознищиться через 5 секунд."
         )
-        await asyncio.sleep(5)
-        await message.delete()
-        await service_message.delete()
+        await message_deleter.schedule(
+            message.chat.id, [message.message_id, service_message.message_id], delay=5
+        )
 
 
 # Define the /ban_me_really handler
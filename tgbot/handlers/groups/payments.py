@@ -1,6 +1,7 @@
 from aiogram import Router, F, Bot
 from aiogram.types import Message, PreCheckoutQuery
 
+from tgbot.services.payments import AI_USAGE_PRICE
 from tgbot.services.token_usage import TokenUsageManager
 
 
@@ -12,7 +13,7 @@ async def checkout_handler(checkout_query: PreCheckoutQuery):
     await checkout_query.answer(ok=True)
 
 
-@payment_router.message(F.successful_payment.total_amount >= 40)
+@payment_router.message(F.successful_payment.total_amount >= AI_USAGE_PRICE)
 async def star_payment(msg: Message, bot: Bot, state):
     usage_manager = TokenUsageManager(storage=state.storage, bot=bot)
     group_id = msg.successful_payment.invoice_payload
@@ -4,8 +4,7 @@ from aiogram import Bot, F, Router, flags, types
 from aiogram.enums import ChatType
 from aiogram.filters import Command, CommandObject, or_f
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.base import StorageKey
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.storage.redis import RedisStorage
 from cachetools import TTLCache
 
 from infrastructure.database.repo.requests import RequestsRepo
@@ -18,8 +17,14 @@ from tgbot.services.rating import (
     POSITIVE_EMOJIS,
     reaction_rating_calculator,
 )
-from tgbot.services.cache_profiles import get_profile_cached
+from tgbot.services.cache_profiles import get_profile_cached, get_profiles_cached
 from tgbot.services.rating import change_rating
+from tgbot.services.rating_events import (
+    RatingEventRecorder,
+    RatingEventSource,
+    get_deltas_since_seen,
+    rating_event,
+)
 
 
 groups_rating_router = Router()
@@ -70,12 +75,10 @@ async def process_new_rating(
 @groups_rating_router.message(Command("top"))
 @flags.rate_limit(limit=0.5 * HOURS, key="top", chat=True)
 async def get_top(m: types.Message, repo: RequestsRepo, bot, state: FSMContext):
-    history_key = StorageKey(bot_id=bot.id, user_id=m.chat.id, chat_id=m.chat.id)
-    state_data = await state.storage.get_data(key=history_key)
-    previous_helpers = state_data.get("top", {})
-
-    current_helpers = await repo.rating_users.get_top_by_rating(50)
-    current_helpers_dict = {user_id: rating for user_id, rating in current_helpers}
+    current_helpers = await repo.rating_users.get_leaderboard(m.chat.id, 50)
+    helper_ids = [user_id for user_id, _ in current_helpers]
+    changes = await get_deltas_since_seen(repo, m.chat.id, "top", helper_ids)
+    profiles = await get_profiles_cached(state.storage, m.chat.id, helper_ids, bot)
 
     kings = []
     sorcerers = []
@@ -84,13 +87,11 @@ async def get_top(m: types.Message, repo: RequestsRepo, bot, state: FSMContext):
     cossacs = []
     pig_herder = []
 
-    for user_id, rating in current_helpers:
-        profile = await get_profile_cached(state.storage, m.chat.id, user_id, bot)
+    for (user_id, rating), profile in zip(current_helpers, profiles):
         if not profile:
             continue
 
-        previous_rating = previous_helpers.get(str(user_id), rating)
-        change = rating - previous_rating
+        change = changes.get(user_id, 0)
         change = (
             f"⬆️ {change}" if change > 0 else f"🔻 {abs(change)}" if change < 0 else ""
         )
@@ -109,8 +110,6 @@ async def get_top(m: types.Message, repo: RequestsRepo, bot, state: FSMContext):
         elif len(pig_herder) < 10:
             pig_herder.append(helper_entry)
 
-    await state.storage.update_data(key=history_key, data={"top": current_helpers_dict})
-
     def format_league(league, league_name, emoji):
         if not league:
             return ""
@@ -173,6 +172,8 @@ async def add_reaction_rating_handler(
     repo: RequestsRepo,
     bot: Bot,
     helper_id: int,
+    rating_events: RatingEventRecorder,
+    storage: RedisStorage,
 ):
     rating_change = await reaction_rating_calculator(
         reaction, repo, helper_id, reaction.user.id
@@ -183,9 +184,8 @@ async def add_reaction_rating_handler(
             f"but the message is not found in the database"
         )
         return
-    try:
-        helper = await bot.get_chat_member(reaction.chat.id, helper_id)
-    except TelegramBadRequest:
+    helper_profile = await get_profile_cached(storage, reaction.chat.id, helper_id, bot)
+    if not helper_profile:
         return
 
     upgraded = await process_new_rating(
@@ -194,13 +194,20 @@ async def add_reaction_rating_handler(
         helper_id,
         reaction.chat.id,
         reaction.user.mention_html(reaction.user.first_name),
-        helper.user.mention_html(helper.user.first_name),
+        helper_profile,
+    )
+    rating_events.record(
+        reaction.chat.id,
+        helper_id,
+        rating_change,
+        RatingEventSource.REACTION,
+        actor_id=reaction.user.id,
     )
     if upgraded:
         new_rating, title = upgraded
         await bot.send_message(
             reaction.chat.id,
-            f"🎉 Вітаємо {helper.user.mention_html(helper.user.first_name)}! Досягнутий рівень: {title}! 🎉",
+            f"🎉 Вітаємо {helper_profile}! Досягнутий рівень: {title}! 🎉",
         )
 
 
@@ -209,13 +216,28 @@ async def add_reaction_rating_handler(
     F.from_user.id == 362089194,
     F.reply_to_message.from_user.id.as_("target_id"),
 )
-async def topup_user(message: types.Message, target_id: int, repo: RequestsRepo):
-    await repo.rating_users.increment_rating_by_user_id(target_id, message.chat.id, 100)
+async def topup_user(
+    message: types.Message,
+    target_id: int,
+    repo: RequestsRepo,
+    rating_events: RatingEventRecorder,
+):
+    new_rating = await repo.rating_users.increment_rating_by_user_id(
+        target_id, message.chat.id, 100
+    )
+    if new_rating is not None:
+        rating_events.record(
+            message.chat.id,
+            target_id,
+            100,
+            RatingEventSource.TOPUP,
+            actor_id=message.from_user.id,
+        )
     await message.answer("Рейтинг поповнено на 100")
 
 
 @groups_rating_router.message(Command("rating"))
-async def get_user_rating(m: types.Message, repo: RequestsRepo, bot, state: FSMContext):
+async def get_user_rating(m: types.Message, repo: RequestsRepo):
     target = m.reply_to_message.from_user if m.reply_to_message else m.from_user
     target_id = target.id
 
@@ -224,13 +246,10 @@ async def get_user_rating(m: types.Message, repo: RequestsRepo, bot, state: FSMC
         await m.reply("Рейтинг користувача не знайдено.")
         return
 
-    # Assume we have a function to get the previous rating and update it
-    previous_rating, _ = await get_and_update_previous_rating(
-        bot, state, target_id, current_rating
-    )
-
-    # Calculate rating change
-    rating_change = current_rating - previous_rating
+    # Rating change since this user's rating was last looked at
+    changes = await get_deltas_since_seen(repo, m.chat.id, str(target_id), [target_id])
+    rating_change = changes.get(target_id, 0)
+    rank = await repo.rating_users.get_rank(m.chat.id, target_id)
 
     # Determine the user's title
     title = determine_user_title(current_rating)
@@ -243,14 +262,25 @@ async def get_user_rating(m: types.Message, repo: RequestsRepo, bot, state: FSMC
         else ""
     )
 
+    rank_text = f"\nМісце в чаті: #{rank}" if rank else ""
+
     await m.reply(
-        f"Рейтинг: {current_rating}{change_text}\n{target.full_name}: {title}"
+        f"Рейтинг: {current_rating}{change_text}\n{target.full_name}: {title}{rank_text}"
     )
 
 
 @groups_rating_router.message(Command("wipe"), F.from_user.id == 362089194)
 async def wipe_user_rating(m: types.Message, repo: RequestsRepo):
-    await repo.rating_users.wipe_ratings()
+    wiped = await repo.rating_users.wipe_ratings()
+    # Every rating of every chat at once, too many for the write-behind buffer
+    await repo.rating_events.add_events(
+        [
+            rating_event(
+                chat_id, user_id, -old_rating, RatingEventSource.WIPE, actor_id=m.from_user.id
+            )
+            for chat_id, user_id, old_rating in wiped
+        ]
+    )
     await m.reply("Рейтинги користувачів було очищено.")
 
 
@@ -269,20 +299,13 @@ def determine_user_title(rating):
         return "👩‍🌾 Свинопас"
 
 
-async def get_and_update_previous_rating(
-    bot: Bot, state: FSMContext, user_id: int, current_rating: int
-):
-    history_key = StorageKey(bot_id=bot.id, user_id=user_id, chat_id=user_id)
-    state_data = await state.storage.get_data(key=history_key)
-    previous_rating = state_data.get("previous_rating", current_rating)
-    # Update the previous rating to the current one for next time
-    await state.storage.update_data(
-        key=history_key, data={"previous_rating": current_rating}
-    )
-    return previous_rating, current_rating - previous_rating
-
 @groups_rating_router.message(Command("setrating"), AdminFilter())
-async def set_user_rating(message: types.Message, command: CommandObject, repo: RequestsRepo):
+async def set_user_rating(
+    message: types.Message,
+    command: CommandObject,
+    repo: RequestsRepo,
+    rating_events: RatingEventRecorder,
+):
     if not message.reply_to_message:
         await message.reply("Цю команду потрібно використовувати як відповідь на повідомлення користувача.")
         return
@@ -297,7 +320,17 @@ async def set_user_rating(message: types.Message, command: CommandObject, repo:
         await message.reply("Новий рейтинг має бути дійсним цілим числом.")
         return
     target_user = message.reply_to_message.from_user
-    await repo.rating_users.update_rating_by_user_id(target_user.id, new_rating)
+    old_rating = await repo.rating_users.update_rating_by_user_id(
+        target_user.id, message.chat.id, new_rating
+    )
+    if old_rating is not None:
+        rating_events.record(
+            message.chat.id,
+            target_user.id,
+            new_rating - old_rating,
+            RatingEventSource.ADMIN,
+            actor_id=message.from_user.id,
+        )
     
     new_title = determine_user_title(new_rating)
     
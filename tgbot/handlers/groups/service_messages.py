@@ -1,16 +1,29 @@
 from aiogram import types, Router
 from aiogram.enums import ChatMemberStatus
 from infrastructure.database.repo.requests import RequestsRepo
+from tgbot.services.chat_admins import ChatAdminsCache
+from tgbot.services.rating_events import RatingEventRecorder, RatingEventSource
 
 service_message_router = Router()
 
 
 @service_message_router.chat_member()
 async def updated_chat_member(
-    chat_member_updated: types.ChatMemberUpdated, repo: RequestsRepo
+    chat_member_updated: types.ChatMemberUpdated,
+    repo: RequestsRepo,
+    chat_admins_cache: ChatAdminsCache,
+    rating_events: RatingEventRecorder,
 ):
     """Хендлер для нових або виключених користувачів"""
 
+    admin_statuses = {ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR}
+    if (
+        chat_member_updated.old_chat_member.status in admin_statuses
+        or chat_member_updated.new_chat_member.status in admin_statuses
+    ):
+        # Список адміністраторів змінився, навіть якщо зміну зробив бот
+        await chat_admins_cache.invalidate(chat_member_updated.chat.id)
+
     performer_mention = chat_member_updated.from_user.mention_html()
     member_mention = chat_member_updated.old_chat_member.user.mention_html()
 
@@ -21,7 +34,17 @@ async def updated_chat_member(
     if chat_member_updated.new_chat_member.status == ChatMemberStatus.MEMBER:
         # Встановити рейтинг 5 для нового користувача
         new_member_id = chat_member_updated.new_chat_member.user.id
-        await repo.rating_users.update_rating_by_user_id(new_member_id, 5)
+        previous_rating = await repo.rating_users.update_rating_by_user_id(
+            new_member_id, chat_member_updated.chat.id, 5
+        )
+        if previous_rating is not None:
+            rating_events.record(
+                chat_member_updated.chat.id,
+                new_member_id,
+                5 - previous_rating,
+                RatingEventSource.NEW_MEMBER,
+                actor_id=chat_member_updated.from_user.id,
+            )
         text = f"{member_mention} був доданий до чату користувачем {performer_mention} і отримав рейтинг 5."
 
     elif chat_member_updated.new_chat_member.status == ChatMemberStatus.KICKED:
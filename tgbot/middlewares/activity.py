@@ -1,19 +1,19 @@
 from aiogram import BaseMiddleware, Dispatcher
 from aiogram.types import Message, CallbackQuery
-from aiogram.fsm.storage.redis import RedisStorage
-import time
+
+from tgbot.services.activity import ActivityTracker
 
 class UserActivityMiddleware(BaseMiddleware):
-    def __init__(self, storage: RedisStorage):
-        self.storage = storage
+    def __init__(self, activity_tracker: ActivityTracker):
+        self.activity_tracker = activity_tracker
 
     async def __call__(self, handler, event, data):
         if isinstance(event, (Message, CallbackQuery)):
             user_id = event.from_user.id
             chat_id = event.chat.id if isinstance(event, Message) else event.message.chat.id
             
-            # Update last activity time in Redis for this specific chat
-            await self.storage.redis.set(f"user_activity:{chat_id}:{user_id}", int(time.time()), ex=172800)  # TTL: 2 days
+            # Update last activity time for this specific chat
+            self.activity_tracker.touch(chat_id, user_id)
         
         return await handler(event, data)
     
@@ -1,5 +1,4 @@
 import logging
-import time
 
 from aiogram import Bot, types
 from aiogram.client.session.middlewares.base import (
@@ -9,15 +8,23 @@ from aiogram.client.session.middlewares.base import (
 from aiogram.methods import SendMessage, TelegramMethod
 from aiogram.methods.base import TelegramType
 
-from infrastructure.database.repo.requests import RequestsRepo
+from tgbot.services.activity import ActivityTracker
+from tgbot.services.chat_archive import ChatMessageArchiver
+from tgbot.services.message_recorder import MessageUserRecorder
 
 logger = logging.getLogger(__name__)
 
 
 class BotMessages(BaseRequestMiddleware):
-    def __init__(self, session_pool, storage):
-        self.session_pool = session_pool
-        self.storage = storage
+    def __init__(
+        self,
+        message_recorder: MessageUserRecorder,
+        activity_tracker: ActivityTracker,
+        chat_archiver: ChatMessageArchiver,
+    ):
+        self.message_recorder = message_recorder
+        self.activity_tracker = activity_tracker
+        self.chat_archiver = chat_archiver
 
     async def __call__(
         self,
@@ -29,18 +36,15 @@ class BotMessages(BaseRequestMiddleware):
             result: types.Message = await make_request(bot, method)
             chat_id = result.chat.id
             user_id = result.from_user.id
-            await self.storage.redis.set(f"user_activity:{chat_id}:{user_id}", int(time.time()), ex=172800)  # TTL: 2 days
-            async with self.session_pool() as session:
-                repo = RequestsRepo(session)
-                await repo.message_user.add_message(
-                    user_id=result.from_user.id,
-                    chat_id=result.chat.id,
-                    message_id=result.message_id,
-                )
-                logging.info(
-                    f"Bot's message added to the database with {result.message_id}"
-                )
-
-                return result
+            self.activity_tracker.touch(chat_id, user_id)
+            self.message_recorder.add_message(
+                user_id=result.from_user.id,
+                chat_id=result.chat.id,
+                message_id=result.message_id,
+            )
+            self.chat_archiver.archive(result)
+            logging.info(f"Bot's message queued for the database with {result.message_id}")
+
+            return result
 
         return await make_request(bot, method)
@@ -1,14 +1,14 @@
-import json
 from typing import Any, Awaitable, Callable, Dict
-from aiogram import BaseMiddleware, types
+from aiogram import BaseMiddleware, Bot
 from aiogram.enums import ChatType
 from aiogram.types import Chat, Message
-from aiogram.fsm.storage.redis import RedisStorage
+
+from tgbot.services.chat_admins import ChatAdminsCache
 
 
 class ChatAdminsMiddleware(BaseMiddleware):
-    def __init__(self, storage: RedisStorage):
-        self.storage = storage
+    def __init__(self, chat_admins_cache: ChatAdminsCache):
+        self.chat_admins_cache = chat_admins_cache
 
     async def __call__(
         self,
@@ -21,25 +21,7 @@ class ChatAdminsMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         if event_chat.type != ChatType.PRIVATE:
-            chat_id = event_chat.id
-            redis_key = f"chat_admins:{chat_id}"
-
-            chat_admins_json = await self.storage.redis.get(redis_key)
-            if not chat_admins_json:
-                chat_admins = await event_chat.get_administrators()
-                chat_admins = {
-                    str(admin.user.id): admin.model_dump() for admin in chat_admins
-                }
-                await self.storage.redis.set(
-                    redis_key, json.dumps(chat_admins), ex=3600
-                )  # Cache for 1 hour
-            else:
-                chat_admins_dict = json.loads(chat_admins_json)
-                chat_admins = {
-                    int(user_id): types.ChatMember(**admin_data)
-                    for user_id, admin_data in chat_admins_dict.items()
-                }
-
-            data["chat_admins"] = chat_admins
+            bot: Bot = data["bot"]
+            data["chat_admins"] = await self.chat_admins_cache.get(bot, event_chat.id)
 
         return await handler(event, data)
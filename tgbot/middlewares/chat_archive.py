@@ -0,0 +1,20 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from tgbot.services.chat_archive import ChatMessageArchiver
+
+
+class ChatArchiveMiddleware(BaseMiddleware):
+    def __init__(self, chat_archiver: ChatMessageArchiver):
+        self.chat_archiver = chat_archiver
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        m: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.chat_archiver.archive(m)
+        return await handler(m, data)
@@ -2,13 +2,15 @@ from typing import Callable, Dict, Any, Awaitable
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message
+from redis.asyncio import Redis
 
 from infrastructure.database.repo.requests import RequestsRepo
 
 
 class DatabaseMiddleware(BaseMiddleware):
-    def __init__(self, session_pool) -> None:
+    def __init__(self, session_pool, redis: Redis) -> None:
         self.session_pool = session_pool
+        self.redis = redis
 
     async def __call__(
         self,
@@ -17,7 +19,7 @@ class DatabaseMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         async with self.session_pool() as session:
-            repo = RequestsRepo(session)
+            repo = RequestsRepo(session, self.redis)
 
             data["repo"] = repo
 
@@ -4,6 +4,7 @@ from aiogram import BaseMiddleware, types
 from openai import AsyncOpenAI
 
 from tgbot.services.rating import change_rating
+from tgbot.services.rating_events import RatingEventRecorder, RatingEventSource
 
 
 class OpenAIModerationMiddleware(BaseMiddleware):
@@ -20,6 +21,14 @@ class OpenAIModerationMiddleware(BaseMiddleware):
         self.client = openai_client
         self.warned_users = dict()
 
+    @staticmethod
+    async def penalize(event: types.Message, change: int, data: Dict[str, Any]) -> None:
+        await change_rating(event.from_user.id, event.chat.id, change, data["repo"])
+        rating_events: RatingEventRecorder = data["rating_events"]
+        rating_events.record(
+            event.chat.id, event.from_user.id, change, RatingEventSource.MODERATION
+        )
+
     async def __call__(
         self,
         handler: Callable[[types.Message, Dict[str, Any]], Awaitable[Any]],
@@ -52,13 +61,13 @@ class OpenAIModerationMiddleware(BaseMiddleware):
                         await event.reply(
                             "Увага: Ви продовжуєте токсично себе поводити. \n\n⚠️Ваш соціальний рейтинг був знижений на 3."
                         )
-                        await change_rating(user_id, event.chat.id, -2, data["repo"])
+                        await self.penalize(event, -2, data)
 
                     elif self.warned_users[user_id]["times"] > 4:
                         await event.reply(
                             "За неодноразове порушення правил. \n\n⚠️Ваш рейтинг був знижений на 5."
                         )
-                        await change_rating(user_id, event.chat.id, -5, data["repo"])
+                        await self.penalize(event, -5, data)
                         # clear the user from the dict
                         del self.warned_users[user_id]
 
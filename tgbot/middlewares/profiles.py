@@ -0,0 +1,30 @@
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.enums import ChatMemberStatus, ChatType
+from aiogram.types import ChatMemberUpdated, Message, MessageReactionUpdated
+
+from tgbot.services.cache_profiles import ProfileRefresher
+
+
+class ProfileRefreshMiddleware(BaseMiddleware):
+    def __init__(self, profile_refresher: ProfileRefresher):
+        self.profile_refresher = profile_refresher
+
+    async def __call__(self, handler, event, data):
+        if isinstance(event, ChatMemberUpdated):
+            if event.new_chat_member.status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED):
+                await self.profile_refresher.member_left(
+                    event.chat.id, event.new_chat_member.user.id
+                )
+        elif isinstance(event, Message) and event.left_chat_member:
+            await self.profile_refresher.member_left(event.chat.id, event.left_chat_member.id)
+        elif isinstance(event, (Message, MessageReactionUpdated)):
+            user = event.from_user if isinstance(event, Message) else event.user
+            if user and event.chat.type != ChatType.PRIVATE:
+                self.profile_refresher.observe(event.chat.id, user)
+
+        return await handler(event, data)
+
+    def setup(self, dp: Dispatcher):
+        dp.message.outer_middleware.register(self)
+        dp.message_reaction.outer_middleware.register(self)
+        dp.chat_member.outer_middleware.register(self)
@@ -5,7 +5,8 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message, MessageReactionUpdated
 
 from infrastructure.database.repo.requests import RequestsRepo
-from tgbot.services.rating import is_rating_cached
+from tgbot.services.message_recorder import MessageUserRecorder
+from tgbot.services.rating import ReactionDedupe
 
 
 class RatingCacheReactionMiddleware(BaseMiddleware):
@@ -15,22 +16,18 @@ class RatingCacheReactionMiddleware(BaseMiddleware):
         reaction: MessageReactionUpdated,
         data: Dict[str, Any],
     ) -> Any:
-        ratings_cache = data["ratings_cache"]
+        reaction_dedupe: ReactionDedupe = data["reaction_dedupe"]
         repo: RequestsRepo = data["repo"]
+        message_recorder: MessageUserRecorder = data["message_recorder"]
 
         user_id = reaction.user.id if reaction.user else reaction.actor_chat.id
         helper_id = (
-            await repo.message_user.get_user_id_by_message_id(
-                reaction.chat.id, reaction.message_id
+            await message_recorder.get_user_id_by_message_id(
+                repo, reaction.chat.id, reaction.message_id
             )
             or reaction.chat.id
         )
-        cached = is_rating_cached(
-            helper_id,
-            user_id,
-            ratings_cache,
-        )
-        if cached:
+        if await reaction_dedupe.is_duplicate(helper_id, user_id):
             logging.info("Cached rating reaction. Ignoring.")
             return
 
@@ -39,13 +36,15 @@ class RatingCacheReactionMiddleware(BaseMiddleware):
 
 
 class MessageUserMiddleware(BaseMiddleware):
+    def __init__(self, message_recorder: MessageUserRecorder):
+        self.message_recorder = message_recorder
+
     async def __call__(
         self,
         handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
         m: Message,
         data: Dict[str, Any],
     ) -> Any:
-        repo: RequestsRepo = data["repo"]
-
-        await repo.message_user.add_message(m.from_user.id, m.chat.id, m.message_id)
+        self.message_recorder.add_message(m.from_user.id, m.chat.id, m.message_id)
         return await handler(m, data)
+
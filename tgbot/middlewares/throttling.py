@@ -1,5 +1,3 @@
-import asyncio
-from contextlib import suppress
 import logging
 from typing import Any, Awaitable, Callable, Dict, Union
 
@@ -12,8 +10,10 @@ from tgbot.misc.time_utils import format_time
 from aiogram.fsm.storage.redis import RedisStorage
 
 from tgbot.services.broadcaster import send_telegram_action
+from tgbot.services.message_deleter import MessageDeleter
 from tgbot.services.payments import payment_keyboard
-from tgbot.services.token_usage import Sonnet, TokenUsageManager
+from tgbot.services.rate_limiter import RateLimiter, RateLimitMode
+from tgbot.services.token_usage import Sonnet, TokenUsageManager, UsageSnapshot
 
 
 class ThrottlingMiddleware(BaseMiddleware):
@@ -21,17 +21,7 @@ class ThrottlingMiddleware(BaseMiddleware):
         super().__init__()
         self.storage: RedisStorage = storage
         self.ai_token_usage = TokenUsageManager(storage=storage,bot=bot)
-
-    async def _get_throttle_count(self, key: str) -> int:
-        count = await self.storage.redis.get(key)
-        return int(count) if count is not None else 0
-
-    async def _set_throttle_count(self, key: str, count: int, ttl: int) -> None:
-        await self.storage.redis.set(key, count, ex=ttl)
-
-    async def _get_remaining_ttl(self, key: str) -> int:
-        ttl = await self.storage.redis.ttl(key)
-        return int(ttl) if ttl > 0 else 0  # Ensure ttl is non-negative
+        self.rate_limiter = RateLimiter(storage.redis)
 
     async def __call__(
         self,
@@ -46,6 +36,14 @@ class ThrottlingMiddleware(BaseMiddleware):
             return await handler(event, data)
         user_id = event_from_user.id
 
+        # Check for AI-related flag
+        is_ai_interaction = get_flag(data, "is_ai_interaction")
+        if is_ai_interaction is not None:
+            # Read once per update, handlers reuse it instead of fetching the cost again
+            data["usage_snapshot"] = await self.ai_token_usage.get_snapshot(
+                event.chat.id, user_id
+            )
+
         rate_limit = get_flag(data, "rate_limit")
         if not rate_limit:
             logging.info(f"No rate limit found: {rate_limit}")
@@ -54,8 +52,6 @@ class ThrottlingMiddleware(BaseMiddleware):
         if self._is_override(data, user_id):
             return await handler(event, data)
 
-        # Check for AI-related flag
-        is_ai_interaction = get_flag(data, "is_ai_interaction")
         bot: Bot = data.get("bot")
 
         key_prefix = rate_limit.get("key", "antiflood")
@@ -63,16 +59,14 @@ class ThrottlingMiddleware(BaseMiddleware):
         max_times = rate_limit.get("max_times", 1)
         chat_marker = rate_limit.get("chat")
         silent = rate_limit.get("silent", False)
+        mode = rate_limit.get("mode", RateLimitMode.FIXED_WINDOW)
 
         key = f"THROTTLING:{key_prefix}:{event.chat.id if chat_marker else user_id}"
-        current_count = await self._get_throttle_count(key)
-        logging.info(f"Current count: {current_count}")
-        logging.info(f"Max times: {max_times}")
-        keyboard = None
     
         # Handle AI interactions
         if is_ai_interaction is not None:
-            usage_cost = await self.ai_token_usage.calculate_cost(Sonnet, event.chat.id, user_id)
+            usage_snapshot: UsageSnapshot = data["usage_snapshot"]
+            usage_cost = usage_snapshot.calculate_cost(Sonnet)
             if usage_cost <= 2:
                 logging.info("User is free from rate limit (ai_interaction)")
                 # No rate limit for AI interactions that don't require payment
@@ -85,30 +79,30 @@ class ThrottlingMiddleware(BaseMiddleware):
                 limit = 600  # 10 minutes
                 max_times = 1
                 data["user_needs_to_pay"] = True
-                keyboard = await payment_keyboard(bot, usage_cost, event.chat.id)
 
-        if current_count >= max_times:
-            remaining_ttl = await self._get_remaining_ttl(key)
+        result = await self.rate_limiter.hit(key, limit, max_times, mode)
+        if not result.allowed:
             logging.info(f"Throttling {user_id} for {key_prefix}")
             if isinstance(event, Message) and not silent:
-                bot = data.get("bot")
+                keyboard = None
+                if data.get("user_needs_to_pay"):
+                    keyboard = await payment_keyboard(
+                        bot, self.storage.redis, event.chat.id
+                    )
                 notification = await send_telegram_action(
                     bot.send_message,
                     chat_id=event.chat.id,
-                    text=f"Занадто часто! Повторіть спробу через {format_time(remaining_ttl)}.",
+                    text=f"Занадто часто! Повторіть спробу через {format_time(result.retry_after)}.",
                     reply_to_message_id=event.message_id,
                     reply_markup=keyboard,
                 )
-                if not is_ai_interaction:
-                    await asyncio.sleep(5)
-                    with suppress(Exception):
-                        # await event.delete()
-                        await notification.delete()
+                if not is_ai_interaction and notification:
+                    message_deleter: MessageDeleter = data["message_deleter"]
+                    await message_deleter.schedule(
+                        event.chat.id, [notification.message_id], delay=5
+                    )
             return 
 
-        # Increment or initialize the throttle count
-        await self._set_throttle_count(key, current_count + 1, int(limit))
-
         # Proceed with the next handler if not throttled
         return await handler(event, data)
 
@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import defaultdict
+
+from redis.asyncio import Redis
+
+from tgbot.services.redis_migrations import run_once
+from tgbot.services.write_behind import DebouncedWriteBuffer
+
+ACTIVITY_RETENTION = 172800  # 2 days
+ACTIVITY_MIGRATION_MARKER = "chat_activity:migrated"
+
+
+def activity_key(chat_id: int) -> str:
+    return f"chat_activity:{chat_id}"
+
+
+async def get_active_users_for_chats(
+    redis: Redis, chat_ids: list[int], since: int
+) -> dict[int, set[int]]:
+    """
+    Ids of users that were active at or after ``since``, for many chats in one
+    pipelined round-trip.
+    """
+    async with redis.pipeline(transaction=False) as pipe:
+        for chat_id in chat_ids:
+            pipe.zrangebyscore(activity_key(chat_id), since, "+inf")
+        results = await pipe.execute()
+    return {
+        chat_id: {int(user_id) for user_id in user_ids}
+        for chat_id, user_ids in zip(chat_ids, results)
+    }
+
+
+class ActivityTracker(DebouncedWriteBuffer):
+    """
+    Records when a user was last active in a chat.
+
+    Each chat has one sorted set of user ids scored by last-seen timestamp, so
+    "who was (in)active since X" is a single range query. Activity only matters
+    at day granularity, so a (chat, user) pair is written at most once per
+    ``min_interval`` seconds. Accepted updates are coalesced in memory and
+    flushed to Redis in one pipeline.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        min_interval: int = 15 * 60,
+        max_size: int = 500,
+        flush_interval: float = 10.0,
+    ):
+        super().__init__(min_interval, max_size=max_size, flush_interval=flush_interval)
+        self.redis = redis
+
+    def touch(self, chat_id: int, user_id: int) -> None:
+        self.offer((chat_id, user_id), int(time.time()))
+
+    async def write(self, batch: dict[tuple[int, int], int]) -> None:
+        chats: dict[int, dict[int, int]] = defaultdict(dict)
+        for (chat_id, user_id), last_seen in batch.items():
+            chats[chat_id][user_id] = last_seen
+
+        retention_threshold = int(time.time()) - ACTIVITY_RETENTION
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for chat_id, last_seen in chats.items():
+                key = activity_key(chat_id)
+                pipe.zadd(key, last_seen)
+                pipe.zremrangebyscore(key, "-inf", retention_threshold)
+                pipe.expire(key, ACTIVITY_RETENTION)
+            await pipe.execute()
+
+
+async def migrate_activity_keys(redis: Redis) -> None:
+    """
+    One-shot move from ``user_activity:{chat_id}:{user_id}`` string keys into
+    the per-chat sorted sets. Old keys are deleted once copied.
+    """
+    migrated = 0
+
+    async def migration() -> None:
+        nonlocal migrated
+        keys = [key async for key in redis.scan_iter(match="user_activity:*:*", count=1000)]
+        for i in range(0, len(keys), 1000):
+            batch_keys = keys[i : i + 1000]
+            values = await redis.mget(batch_keys)
+
+            chats: dict[int, dict[int, int]] = defaultdict(dict)
+            for key, last_seen in zip(batch_keys, values):
+                if last_seen is None:
+                    continue
+                key = key.decode() if isinstance(key, bytes) else key
+                _, chat_id, user_id = key.rsplit(":", 2)
+                chats[int(chat_id)][int(user_id)] = int(last_seen)
+
+            async with redis.pipeline(transaction=False) as pipe:
+                for chat_id, last_seen in chats.items():
+                    # GT keeps a newer timestamp already written by ActivityTracker
+                    pipe.zadd(activity_key(chat_id), last_seen, gt=True)
+                    pipe.expire(activity_key(chat_id), ACTIVITY_RETENTION)
+                pipe.delete(*batch_keys)
+                await pipe.execute()
+            migrated += sum(len(last_seen) for last_seen in chats.values())
+
+    if await run_once(redis, ACTIVITY_MIGRATION_MARKER, migration):
+        logging.info(f"Migrated {migrated} user activity keys into per-chat sorted sets")
@@ -1,10 +1,17 @@
+import asyncio
+import hashlib
 from datetime import datetime
 from enum import Enum
 import logging
-from typing import List
+from typing import List, Optional
 from aiogram.utils.markdown import hlink, hunderline
 from pydantic import BaseModel, Field
 from openai import AsyncOpenAI, pydantic_function_tool
+from redis.asyncio import Redis
+
+# Part of the chunk summary cache key; bump when the chunk prompt changes
+CHUNK_SUMMARY_VERSION = 1
+CHUNK_SUMMARY_TTL = 7 * 24 * 3600
 
 class TimeOfDay(str, Enum):
     morning = "morning"
@@ -73,6 +80,122 @@ The current date is {current_date}."""
 
     return completion.choices[0].message.tool_calls[0].function.parsed_arguments
 
+async def merge_chat_summaries(client: AsyncOpenAI, summaries: List[ChatHistorySummary],
+                               num_topics: int = 10, with_bot: bool = True
+                               ) -> ChatHistorySummary:
+    num_topics = max(3, num_topics)
+    bot_guideline = "" if with_bot else (
+        "\n- Leave out topics that are only conversations with the AI assistant bot."
+    )
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    partial_summaries = "\n".join(summary.model_dump_json() for summary in summaries)
+    logging.info(f"Merging {len(summaries)} chunk summaries into {num_topics} topics")
+    completion = await client.beta.chat.completions.parse(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": f"""You are an AI assistant specialized in summarizing chat histories.
+You are given partial summaries of consecutive parts of one chat history, one JSON object per line, in chronological order.
+Your task is to merge them into one structured summary using Ukrainian language.
+Follow these guidelines:
+- Group topics by date and time of day (morning: 06:00-11:59, afternoon: 12:00-17:59, evening: 18:00-23:59, night: 00:00-05:59)
+- Each summary object contains a list of topics in chronological order.
+- Merge topics that continue the same discussion across parts; keep the earliest time and message link.
+- List from {num_topics} to {num_topics + 2} distinct topics, dropping the least significant ones.
+- Ensure each topic description is unique and informative.
+- Only use message links and times that appear in the partial summaries.
+- Mention the user names (main actors) in the topic descriptions.{bot_guideline}
+
+The current date is {current_date}."""
+            },
+            {
+                "role": "user",
+                "content": f"Merge these partial summaries:\n\n{partial_summaries}"
+            }
+        ],
+        tools=[
+            pydantic_function_tool(ChatHistorySummary),
+        ],
+    )
+
+    return completion.choices[0].message.tool_calls[0].function.parsed_arguments
+
+
+class HistorySummarizer:
+    """
+    Map-reduce summarization of chat history.
+
+    Messages are split into chunks aligned to ``chunk_size`` buckets of message
+    ids, so runs over overlapping windows produce the same chunks. Chunks are
+    summarized concurrently, each summary cached in Redis by the hash of the
+    chunk text alone, and one reduce call merges them into the final summary.
+    The number of topics and the caller's filters only shape the reduce step,
+    so every caller rendering the same messages shares the chunk summaries.
+    A chunk that is already being summarized is awaited instead of requested
+    again, so overlapping runs share the work.
+    """
+
+    def __init__(self, client: AsyncOpenAI, redis: Redis, chunk_size: int = 100,
+                 concurrency: int = 4, ttl: int = CHUNK_SUMMARY_TTL):
+        self.client = client
+        self.redis = redis
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    def _chunks(self, messages: List[tuple[int, str]]) -> List[List[str]]:
+        # Buckets are never merged with their neighbours: a full bucket has the
+        # same text whatever window it was cut from
+        buckets: dict[int, List[str]] = {}
+        for message_id, line in sorted(messages):
+            buckets.setdefault(message_id // self.chunk_size, []).append(line)
+        return list(buckets.values())
+
+    async def _summarize_chunk(self, digest: str, text: str, num_topics: int) -> ChatHistorySummary:
+        key = f"history_chunk_summary:{digest}"
+        cached = await self.redis.get(key)
+        if cached:
+            return ChatHistorySummary.model_validate_json(cached)
+
+        async with self._semaphore:
+            summary = await summarize_chat_history(self.client, text, num_topics=num_topics)
+        await self.redis.set(key, summary.model_dump_json(), ex=self.ttl)
+        return summary
+
+    async def _chunk_summary(self, lines: List[str]) -> ChatHistorySummary:
+        text = "\n".join(lines)
+        digest = hashlib.sha256(f"{CHUNK_SUMMARY_VERSION}\n{text}".encode()).hexdigest()
+        task = self._in_flight.get(digest)
+        if task is None:
+            task = asyncio.create_task(self._summarize_chunk(digest, text, len(lines) // 30))
+            self._in_flight[digest] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(digest, None))
+        # A caller giving up must not cancel the chunk for the other runs
+        return await asyncio.shield(task)
+
+    async def summarize(self, messages: List[tuple[int, str]], num_topics: int = 10,
+                        with_bot: bool = True) -> Optional[ChatHistorySummary]:
+        """
+        :param messages: (message_id, prompt line) pairs of the messages to summarize,
+            rendered the same way by every caller.
+        :param num_topics: Number of topics in the final summary.
+        :param with_bot: Whether conversations with the assistant may be topics.
+        :return: The summary, or None if there are no messages.
+        """
+        if not messages:
+            return None
+
+        chunks = self._chunks(messages)
+        logging.info(f"Summarizing {len(messages)} messages in {len(chunks)} chunks")
+        summaries = await asyncio.gather(*(self._chunk_summary(lines) for lines in chunks))
+        # Even a single chunk goes through the reduce step, which applies num_topics
+        return await merge_chat_summaries(
+            self.client, list(summaries), num_topics=num_topics, with_bot=with_bot
+        )
+
+
 def format_summary(summary: ChatHistorySummary) -> str:
     formatted_output = ""
     
@@ -1,59 +1,202 @@
 import asyncio
 import logging
-from datetime import datetime
 
-from aiogram import Bot
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.storage.redis import RedisStorage
-from aiogram.fsm.storage.base import StorageKey
 from aiogram.utils.markdown import hlink
+from redis.asyncio import Redis
+
+from tgbot.services.redis_migrations import migrate_fsm_data
+from tgbot.services.write_behind import DebouncedWriteBuffer
+
+PROFILE_CACHE_TTL = 86400
+MEMBERSHIP_CACHE_TTL = 6 * 60 * 60
+PROFILES_MIGRATION_MARKER = "profile:{bot_id}:migrated"
+# Concurrent getChatMember calls of one batch, well under the Bot API limit of
+# about 30 requests per second
+PROFILE_FETCH_CONCURRENCY = 8
+PROFILE_FETCH_ATTEMPTS = 3
+ACTIVE_MEMBER_STATUSES = {"member", "administrator", "creator", "restricted"}
+
+
+def format_profile(user: types.User) -> str:
+    return hlink(title=user.full_name, url=f"tg://user?id={user.id}")
 
 
 async def get_profile(group_id: int, chat_id: int, bot: Bot) -> str | bool:
-    await asyncio.sleep(0.1)  # Simulating an async call
-    try:
-        logging.info(f"Getting profile for {chat_id}")
-        member = await bot.get_chat_member(group_id, chat_id)
-        if member.status not in ["member", "administrator", "creator", "restricted"]:
+    """
+    Profile of a group member, or False if they are not in the group.
+
+    Flood control is waited out up to ``PROFILE_FETCH_ATTEMPTS`` times; other API
+    errors propagate so they are not cached as "not a member".
+    """
+    logging.info(f"Getting profile for {chat_id}")
+    for attempt in range(1, PROFILE_FETCH_ATTEMPTS + 1):
+        try:
+            member = await bot.get_chat_member(group_id, chat_id)
+            break
+        except TelegramRetryAfter as e:
+            if attempt == PROFILE_FETCH_ATTEMPTS:
+                raise
+            logging.warning(f"Flood control while getting profile for {chat_id}, retrying in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest:
+            # The user is unknown to the chat
             return False
-    except Exception:
+
+    if member.status not in ACTIVE_MEMBER_STATUSES:
         return False
+    return format_profile(member.user)
+
+
+def profile_key(bot_id: int, group_id: int, user_id: int) -> str:
+    return f"profile:{bot_id}:{group_id}:{user_id}"
+
+
+def membership_key(bot_id: int, group_id: int, user_id: int) -> str:
+    return f"membership:{bot_id}:{group_id}:{user_id}"
+
+
+async def get_profiles_cached(
+    storage: RedisStorage,
+    group_id: int,
+    user_ids: list[int],
+    bot: Bot,
+    concurrency: int = PROFILE_FETCH_CONCURRENCY,
+) -> list[str | bool | None]:
+    """
+    Profiles of many users of one group, in the order of ``user_ids``.
+
+    Names and membership are cached under separate keys: names are refreshed
+    passively from updates by ``ProfileRefresher``, membership expires sooner.
+    Both are read with one MGET. ``getChatMember`` is called only for users
+    whose membership or name is unknown, at most ``concurrency`` at a time,
+    and its results are stored back in one pipeline. Users that are no longer
+    in the group resolve to False. Users whose lookup failed with an API error
+    resolve to None and are not cached, so one failure does not fail the batch.
+    """
+    redis = storage.redis
+    unique_ids = list(dict.fromkeys(user_ids))
+    if not unique_ids:
+        return []
+
+    cached = await redis.mget(
+        [profile_key(bot.id, group_id, user_id) for user_id in unique_ids]
+        + [membership_key(bot.id, group_id, user_id) for user_id in unique_ids]
+    )
+    names, memberships = cached[: len(unique_ids)], cached[len(unique_ids) :]
+    profiles: dict[int, str | bool | None] = {}
+    missing = []
+    for user_id, profile, is_member in zip(unique_ids, names, memberships):
+        if is_member is not None and not int(is_member):
+            profiles[user_id] = False
+        elif is_member is not None and profile is not None:
+            profiles[user_id] = profile.decode() if isinstance(profile, bytes) else profile
+        else:
+            missing.append(user_id)
+    logging.info(f"{len(profiles)} of {len(unique_ids)} profiles in {group_id} are cached")
 
-    full_name = member.user.full_name
-    if member.user.id == bot.id:
-        full_name += " (bot)"
+    if missing:
+        semaphore = asyncio.Semaphore(concurrency)
 
-    return hlink(title=member.user.full_name, url=f"tg://user?id={chat_id}")
+        async def fetch(user_id: int) -> str | bool | None:
+            async with semaphore:
+                try:
+                    return await get_profile(group_id, user_id, bot)
+                except TelegramAPIError as e:
+                    logging.warning(f"Could not get profile of {user_id} in {group_id}: {e}")
+                    return None
+
+        fetched = await asyncio.gather(*(fetch(user_id) for user_id in missing))
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id, profile in zip(missing, fetched):
+                profiles[user_id] = profile
+                if profile is None:
+                    continue
+                pipe.set(
+                    membership_key(bot.id, group_id, user_id),
+                    int(bool(profile)),
+                    ex=MEMBERSHIP_CACHE_TTL,
+                )
+                if profile:
+                    pipe.set(
+                        profile_key(bot.id, group_id, user_id),
+                        profile,
+                        ex=PROFILE_CACHE_TTL,
+                    )
+            await pipe.execute()
+
+    return [profiles[user_id] for user_id in user_ids]
 
 
 async def get_profile_cached(
     storage: RedisStorage, group_id: int, chat_id: int, bot: Bot
-) -> str | bool:
-    key = f"{group_id}_{chat_id}"
-    storage_key = StorageKey(bot.id, group_id, group_id)
-    now = datetime.now()
-
-    group_data = await storage.get_data(storage_key)
-    user_profiles = group_data.get("user_profiles", {})
-
-    # Convert stored timestamp back to datetime for comparison
-    update_time = user_profiles.get(key, {}).get("update_time", 0)
-    update_time_datetime = datetime.fromtimestamp(update_time) if update_time else None
-
-    # Check if the profile exists and is up to date
-    if (
-        key in user_profiles
-        and update_time_datetime
-        and (now - update_time_datetime).total_seconds() < 86400
+) -> str | bool | None:
+    [profile] = await get_profiles_cached(storage, group_id, [chat_id], bot)
+    return profile
+
+
+async def drop_profiles_from_fsm(storage: RedisStorage, bot: Bot) -> None:
+    """
+    One-shot removal of the old group-wide ``user_profiles`` blobs from FSM data.
+
+    They were only a cache, so they are dropped rather than copied; profiles are
+    fetched again on first use.
+    """
+
+    async def migrate_record(data_key: str, group_state: dict) -> bool:
+        return group_state.pop("user_profiles", None) is not None
+
+    dropped = await migrate_fsm_data(
+        storage, bot, PROFILES_MIGRATION_MARKER.format(bot_id=bot.id), migrate_record
+    )
+    if dropped is not None:
+        logging.info(f"Dropped cached profiles from {dropped} FSM records")
+
+
+class ProfileRefresher(DebouncedWriteBuffer):
+    """
+    Keeps cached profiles fresh from the users the bot sees in updates.
+
+    Anyone who sends a message or reaction in a group is a member of it, so
+    their name and membership are stored without a Bot API call. A profile is
+    rewritten only when the name changed or ``min_interval`` seconds passed,
+    and accepted writes are flushed to Redis in one pipeline.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        redis: Redis,
+        min_interval: int = 60 * 60,
+        max_size: int = 500,
+        flush_interval: float = 10.0,
     ):
-        logging.info(f"Profile for {chat_id} is cached")
-        return user_profiles[key]["profile"]
+        super().__init__(min_interval, max_size=max_size, flush_interval=flush_interval)
+        self.bot = bot
+        self.redis = redis
 
-    # If profile is not present or outdated, fetch a new one
-    profile = await get_profile(group_id, chat_id, bot)
-    if profile:
-        # Convert datetime to timestamp for storage
-        user_profiles[key] = {"profile": profile, "update_time": now.timestamp()}
+    def observe(self, group_id: int, user: types.User) -> None:
+        profile = format_profile(user)
+        self.offer((group_id, user.id), profile, fingerprint=profile)
 
-    # Update storage with new or updated profile data
-    await storage.update_data(storage_key, {"user_profiles": user_profiles})
-    return profile
+    async def member_left(self, group_id: int, user_id: int) -> None:
+        """Forget the cached membership of a user who left or was removed."""
+        self.forget((group_id, user_id))
+        await self.redis.delete(membership_key(self.bot.id, group_id, user_id))
+
+    async def write(self, batch: dict[tuple[int, int], str]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for (group_id, user_id), profile in batch.items():
+                pipe.set(
+                    profile_key(self.bot.id, group_id, user_id),
+                    profile,
+                    ex=PROFILE_CACHE_TTL,
+                )
+                pipe.set(
+                    membership_key(self.bot.id, group_id, user_id),
+                    1,
+                    ex=MEMBERSHIP_CACHE_TTL,
+                )
+            await pipe.execute()
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram import Bot, types
+from aiogram.enums import ChatMemberStatus
+from redis.asyncio import Redis
+
+from tgbot.filters.permissions import ChatMemberType
+
+ADMIN_TYPES = {
+    ChatMemberStatus.CREATOR: types.ChatMemberOwner,
+    ChatMemberStatus.ADMINISTRATOR: types.ChatMemberAdministrator,
+}
+
+# Stores a refreshed admin list only if no invalidation happened since the
+# refresh started: KEYS = cache, generation; ARGV = generation, payload, ttl
+ADMINS_STORE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class ChatAdminsCache:
+    """
+    Two-tier cache of chat administrators.
+
+    L1 keeps already-built ``ChatMember`` objects in process memory and is
+    revalidated against Redis (L2) every ``local_ttl`` seconds, so invalidations
+    from other processes are picked up quickly. L2 holds the raw admin list for
+    ``ttl`` seconds. Once an entry is older than ``refresh_ahead`` of its TTL it
+    is refreshed from the Bot API in the background, so updates never wait on
+    ``getChatAdministrators`` for a chat that is in use.
+
+    Every invalidation bumps a per-chat generation, locally and in Redis. A
+    refresh that was already in flight when the chat was invalidated sees a
+    different generation and discards its now stale result.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int = 3600,
+        local_ttl: int = 60,
+        refresh_ahead: float = 0.8,
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.refresh_ahead = refresh_ahead
+        # chat_id -> (checked_at, fetched_at, admins)
+        self._local: dict[int, tuple[float, float, dict[int, ChatMemberType]]] = {}
+        self._refreshing: dict[int, asyncio.Task] = {}
+        self._generations: dict[int, int] = {}
+        self._store = redis.register_script(ADMINS_STORE_SCRIPT)
+
+    @staticmethod
+    def _key(chat_id: int) -> str:
+        return f"chat_admins_cache:{chat_id}"
+
+    @staticmethod
+    def _generation_key(chat_id: int) -> str:
+        return f"chat_admins_generation:{chat_id}"
+
+    async def get(self, bot: Bot, chat_id: int) -> dict[int, ChatMemberType]:
+        now = time.time()
+        entry = self._local.get(chat_id)
+        if entry and now - entry[0] < self.local_ttl:
+            _, fetched_at, admins = entry
+        else:
+            cached = await self.redis.get(self._key(chat_id))
+            if not cached:
+                return await self._refresh(bot, chat_id)
+            payload = json.loads(cached)
+            fetched_at = payload["fetched_at"]
+            admins = {
+                int(user_id): ADMIN_TYPES[admin_data["status"]](**admin_data)
+                for user_id, admin_data in payload["admins"].items()
+            }
+            self._local[chat_id] = (now, fetched_at, admins)
+
+        if now - fetched_at > self.ttl * self.refresh_ahead:
+            self._refresh_in_background(bot, chat_id)
+        return admins
+
+    async def _refresh(self, bot: Bot, chat_id: int) -> dict[int, ChatMemberType]:
+        local_generation = self._generations.get(chat_id, 0)
+        generation = await self.redis.get(self._generation_key(chat_id))
+        generation = generation.decode() if isinstance(generation, bytes) else generation
+        chat_admins = await bot.get_chat_administrators(chat_id)
+        admins = {admin.user.id: admin for admin in chat_admins}
+        now = time.time()
+        payload = {
+            "fetched_at": now,
+            "admins": {
+                str(user_id): admin.model_dump(mode="json")
+                for user_id, admin in admins.items()
+            },
+        }
+        stored = await self._store(
+            keys=[self._key(chat_id), self._generation_key(chat_id)],
+            args=[generation or "0", json.dumps(payload), self.ttl],
+        )
+        if stored and self._generations.get(chat_id, 0) == local_generation:
+            self._local[chat_id] = (now, now, admins)
+        else:
+            logging.info(f"Admins of chat {chat_id} were invalidated during a refresh, not caching")
+        return admins
+
+    def _refresh_in_background(self, bot: Bot, chat_id: int) -> None:
+        if chat_id in self._refreshing:
+            return
+
+        def done(task: asyncio.Task):
+            self._refreshing.pop(chat_id, None)
+            if not task.cancelled() and task.exception():
+                logging.error(
+                    f"Failed to refresh admins of chat {chat_id}: {task.exception()}"
+                )
+
+        task = asyncio.create_task(self._refresh(bot, chat_id))
+        task.add_done_callback(done)
+        self._refreshing[chat_id] = task
+
+    async def invalidate(self, chat_id: int) -> None:
+        self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+        self._local.pop(chat_id, None)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(self._generation_key(chat_id))
+            pipe.expire(self._generation_key(chat_id), self.ttl)
+            pipe.delete(self._key(chat_id))
+            await pipe.execute()
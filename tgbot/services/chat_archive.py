@@ -0,0 +1,217 @@
+import datetime
+import html
+import logging
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import pyrogram.errors
+from aiogram import types
+from aiogram.utils.text_decorations import html_decoration as hd
+from pyrogram.client import Client
+from pyrogram.types import Message as PyrogramMessage
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from infrastructure.database.models.tables import ChatMessages
+from infrastructure.database.repo.requests import RequestsRepo
+from tgbot.services.write_behind import WriteBehindBuffer
+
+# Bump whenever render_line changes; lines rendered by an older version are
+# re-rendered when read instead of being migrated
+RENDER_VERSION = 1
+HISTORY_TIMEZONE = ZoneInfo("Europe/Kiev")
+# Pyrogram resolves ``replies`` with one RPC per hop, so the part of a reply
+# chain fetched over MTProto is kept short
+MTPROTO_REPLY_CHAIN_DEPTH = 3
+
+
+def render_line(
+    date: datetime.datetime,
+    user_name: str,
+    username: Optional[str],
+    content: str,
+    url: Optional[str],
+) -> str:
+    """The prompt line of one message, as the AI sees it in chat history."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    formatted_date = date.astimezone(HISTORY_TIMEZONE).strftime("%Y-%m-%d %H:%M")
+    user = f"{user_name} @{username}" if username else user_name
+    return (
+        f"<time>{formatted_date}</time><user>{hd.quote(user)}</user>:"
+        f"<message>{hd.quote(content)}</message><message_url>{url}</message_url>"
+    )
+
+
+def rendered(row: dict) -> dict:
+    """Add the pre-rendered prompt line to a ChatMessages row."""
+    row["rendered"] = render_line(
+        row["date"], row["user_name"], row["username"], row["content"], row["url"]
+    )
+    row["render_version"] = RENDER_VERSION
+    return row
+
+
+def render_row(row: ChatMessages) -> str:
+    if row.render_version == RENDER_VERSION and row.rendered:
+        return row.rendered
+    return render_line(row.date, row.user_name, row.username, row.content, row.url)
+
+
+def render_history_message(msg: dict) -> str:
+    """The prompt line of a chat history list entry."""
+    if msg.get("render_version") == RENDER_VERSION and msg.get("line"):
+        return msg["line"]
+    # History list fields are stored HTML-quoted
+    return render_line(
+        datetime.datetime.fromisoformat(msg["date"]),
+        html.unescape(msg["user"]),
+        None,
+        html.unescape(msg["content"]),
+        msg["url"],
+    )
+
+
+def archived_message(message: types.Message) -> Optional[dict]:
+    """ChatMessages row for a message, or None if it has nothing worth keeping."""
+    if not (message.text or message.caption or message.photo):
+        return None
+    author = message.forward_from_chat or message.from_user
+    row = {
+        "chat_id": message.chat.id,
+        "message_id": message.message_id,
+        "date": message.date,
+        "user_id": message.from_user.id if message.from_user else None,
+        "user_name": author.full_name if author else "unknown",
+        "username": message.from_user.username if message.from_user else None,
+        "content": message.text or message.caption or "",
+        "reply_to_id": message.reply_to_message.message_id
+        if message.reply_to_message
+        else None,
+        "url": message.get_url(),
+        "photo_file_id": message.photo[-1].file_id if message.photo else None,
+    }
+    return rendered(row)
+
+
+def pyrogram_archived_message(msg: PyrogramMessage) -> dict:
+    """ChatMessages row for a message fetched over MTProto."""
+    if msg.forward_from_chat:
+        user_name = msg.forward_from_chat.title or "unknown"
+    elif msg.from_user:
+        user_name = f"{msg.from_user.first_name or ''} {msg.from_user.last_name or ''}".strip()
+    else:
+        user_name = "unknown"
+    row = {
+        "chat_id": msg.chat.id,
+        "message_id": msg.id,
+        # Pyrogram dates are naive local time
+        "date": msg.date.astimezone(datetime.timezone.utc),
+        "user_id": msg.from_user.id if msg.from_user else None,
+        "user_name": user_name,
+        "username": msg.from_user.username if msg.from_user else None,
+        "content": str(msg.text or msg.caption or ""),
+        "reply_to_id": msg.reply_to_message_id,
+        "url": msg.link,
+        "photo_file_id": msg.photo.file_id if msg.photo else None,
+    }
+    return rendered(row)
+
+
+def to_history_message(row: ChatMessages) -> dict:
+    """An archived message in the format of the chat history list."""
+    return {
+        "date": row.date.isoformat(),
+        "user": hd.quote(row.user_name),
+        "content": hd.quote(row.content),
+        "url": row.url,
+        "reply_to_id": row.reply_to_id,
+        "message_id": row.message_id,
+        "line": render_row(row),
+        "render_version": RENDER_VERSION,
+    }
+
+
+class ChatMessageArchiver(WriteBehindBuffer):
+    """
+    Archives chat messages into the ChatMessages table with write-behind batching.
+
+    Rows are keyed by (chat_id, message_id) and flushed as one multi-row INSERT
+    that skips messages already archived.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        max_size: int = 200,
+        flush_interval: float = 2.0,
+    ):
+        super().__init__(max_size=max_size, flush_interval=flush_interval)
+        self.session_pool = session_pool
+
+    def archive(self, message: types.Message) -> None:
+        row = archived_message(message)
+        if row:
+            self.add((row["chat_id"], row["message_id"]), row)
+
+    async def write(self, batch: dict[tuple[int, int], dict]) -> None:
+        async with self.session_pool() as session:
+            repo = RequestsRepo(session)
+            await repo.chat_messages.add_messages(list(batch.values()))
+        logging.info(f"Archived {len(batch)} chat messages")
+
+
+async def resolve_reply_chain(
+    repo: RequestsRepo,
+    client: Client,
+    chat_archiver: ChatMessageArchiver,
+    chat_id: int,
+    message_id: int,
+    max_length: int = 5,
+) -> list[ChatMessages]:
+    """
+    The message and the messages it replies to, oldest first.
+
+    Hops are served from the archiver's buffer, then from the archive with one
+    recursive query. Only the part of the chain that is not archived is fetched
+    over MTProto with ``get_messages(replies=...)``. Pyrogram issues one request
+    per hop for that, so at most ``MTPROTO_REPLY_CHAIN_DEPTH`` messages are
+    fetched; they are archived so the next lookup stays local.
+    """
+    chain: list[ChatMessages] = []  # newest first
+    next_id = message_id
+
+    # Messages that are still buffered are not in the database yet
+    while next_id and len(chain) < max_length:
+        row = chat_archiver.get((chat_id, next_id))
+        if row is None:
+            break
+        chain.append(ChatMessages(**row))
+        next_id = row["reply_to_id"]
+
+    if next_id and len(chain) < max_length:
+        archived = await repo.chat_messages.get_reply_chain(
+            chat_id, next_id, max_length - len(chain)
+        )
+        if archived:
+            chain.extend(reversed(archived))
+            next_id = archived[0].reply_to_id
+
+    if next_id and len(chain) < max_length:
+        remaining = min(max_length - len(chain), MTPROTO_REPLY_CHAIN_DEPTH)
+        try:
+            message = await client.get_messages(
+                chat_id=chat_id, message_ids=next_id, replies=remaining - 1
+            )
+        except pyrogram.errors.exceptions.bad_request_400.MessageIdsEmpty:
+            message = None
+        fetched = 0
+        while message and not message.empty and fetched < remaining:
+            row = pyrogram_archived_message(message)
+            chain.append(ChatMessages(**row))
+            if row["content"] or row["photo_file_id"]:
+                chat_archiver.add((chat_id, row["message_id"]), row)
+            fetched += 1
+            message = message.reply_to_message
+        logging.info(f"Fetched {fetched} reply chain messages over MTProto")
+
+    return list(reversed(chain))
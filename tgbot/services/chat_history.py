@@ -0,0 +1,143 @@
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import Redis
+
+from tgbot.services.redis_migrations import migrate_fsm_data
+
+CHAT_HISTORY_LIMIT = 400
+CHAT_HISTORY_PAGE = 50
+CHAT_HISTORY_SEED_TTL = 60
+CHAT_HISTORY_MIGRATION_MARKER = "chat_history:{bot_id}:migrated"
+
+
+class ChatHistoryStore:
+    """
+    Recent messages of each chat, kept as a capped Redis list.
+
+    Every message is one JSON list element, so appending is a single
+    RPUSH + LTRIM and reads fetch only the range they need instead of the
+    whole history.
+    """
+
+    def __init__(self, redis: Redis, limit: int = CHAT_HISTORY_LIMIT):
+        self.redis = redis
+        self.limit = limit
+
+    @staticmethod
+    def _key(chat_id: int) -> str:
+        return f"chat_history:{chat_id}"
+
+    async def append(self, chat_id: int, *messages: dict) -> None:
+        if not messages:
+            return
+        key = self._key(chat_id)
+        async with self.redis.pipeline() as pipe:
+            pipe.rpush(key, *[json.dumps(message) for message in messages])
+            pipe.ltrim(key, -self.limit, -1)
+            await pipe.execute()
+
+    async def exists(self, chat_id: int) -> bool:
+        return bool(await self.redis.exists(self._key(chat_id)))
+
+    async def claim_seed(self, chat_id: int) -> bool:
+        """
+        Whether the caller should seed the chat's history; only one of concurrent
+        callers is told to.
+        """
+        return bool(
+            await self.redis.set(
+                f"chat_history_seed:{chat_id}", 1, nx=True, ex=CHAT_HISTORY_SEED_TTL
+            )
+        )
+
+    async def seed(self, chat_id: int, messages: list[dict]) -> None:
+        """
+        Prepend messages that predate the history, e.g. from the archive.
+
+        Live messages are only ever appended, so the head of the list is stable
+        and anything not older than it is already there.
+        """
+        key = self._key(chat_id)
+        head = await self.redis.lindex(key, 0)
+        if head is not None:
+            first_id = json.loads(head)["message_id"]
+            messages = [message for message in messages if message["message_id"] < first_id]
+        if not messages:
+            return
+        messages = sorted(messages, key=lambda message: message["message_id"])
+        async with self.redis.pipeline() as pipe:
+            pipe.lpush(key, *[json.dumps(message) for message in reversed(messages)])
+            pipe.ltrim(key, -self.limit, -1)
+            await pipe.execute()
+
+    async def get_messages(self, chat_id: int, count: Optional[int] = None) -> list[dict]:
+        """The last ``count`` messages (all of them by default), oldest first."""
+        start = -count if count else 0
+        raw_messages = await self.redis.lrange(self._key(chat_id), start, -1)
+        return [json.loads(raw) for raw in raw_messages]
+
+    async def _iter_newest_first(self, chat_id: int) -> AsyncIterator[dict]:
+        """Messages newest first, read from the tail one page at a time."""
+        key = self._key(chat_id)
+        end = -1
+        while True:
+            page = await self.redis.lrange(key, end - CHAT_HISTORY_PAGE + 1, end)
+            for raw in reversed(page):
+                yield json.loads(raw)
+            if len(page) < CHAT_HISTORY_PAGE:
+                return
+            end -= CHAT_HISTORY_PAGE
+
+    async def get_messages_after(self, chat_id: int, message_id: int) -> list[dict]:
+        messages = []
+        async for message in self._iter_newest_first(chat_id):
+            if message["message_id"] <= message_id:
+                break
+            messages.append(message)
+        return list(reversed(messages))
+
+    async def get_reply_chain(
+        self, chat_id: int, message_id: int, max_length: int = 4
+    ) -> list[dict]:
+        """The message and the messages it replies to, oldest first."""
+        chain = []
+        next_id = message_id
+        async for message in self._iter_newest_first(chat_id):
+            # Replies point back in time, so nothing older can be in the chain
+            if not next_id or message["message_id"] < next_id:
+                break
+            if message["message_id"] == next_id:
+                chain.append(message)
+                next_id = message.get("reply_to_id")
+                if len(chain) >= max_length:
+                    break
+        return list(reversed(chain))
+
+
+async def migrate_history_from_fsm(
+    storage: RedisStorage, bot: Bot, chat_history: ChatHistoryStore
+) -> None:
+    """
+    One-shot move of the ``messages_history`` JSON blobs from chat FSM data into
+    the per-chat lists.
+    """
+
+    async def migrate_record(data_key: str, chat_state: dict) -> bool:
+        messages_history = chat_state.pop("messages_history", None)
+        if messages_history is None:
+            return False
+
+        _, _, chat_id, *_ = data_key.split(":")
+        messages = json.loads(messages_history) if messages_history else []
+        await chat_history.append(int(chat_id), *messages)
+        return True
+
+    migrated = await migrate_fsm_data(
+        storage, bot, CHAT_HISTORY_MIGRATION_MARKER.format(bot_id=bot.id), migrate_record
+    )
+    if migrated is not None:
+        logging.info(f"Migrated message history of {migrated} chats from FSM storage")
@@ -1,40 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import suppress
+
 from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
 from aiogram.fsm.storage.redis import RedisStorage
-from aiogram.fsm.storage.base import StorageKey
 from aiogram.types import BotCommand, BotCommandScopeChatMember
-from tgbot.misc.default_commands import commands_members, commands_admins
-
-async def get_user_command_usage(storage: RedisStorage, bot_id: int, chat_id: int, user_id: int) -> dict:
-    storage_key = StorageKey(bot_id, chat_id, user_id)
-    data = await storage.get_data(storage_key)
-    return data.get("command_usage", {})
-
-async def update_command_usage(storage: RedisStorage, bot_id: int, chat_id: int, user_id: int, command: str):
-    storage_key = StorageKey(bot_id, chat_id, user_id)
-    data = await storage.get_data(storage_key)
-    command_usage = data.get("command_usage", {})
-    
-    for cmd in commands_members.keys():
-        command_usage.setdefault(cmd, 0)
-    
-    command_usage[command] = command_usage.get(command, 0) + 1
-    await storage.update_data(storage_key, {"command_usage": command_usage})
-
-async def get_sorted_commands(storage: RedisStorage, bot_id: int, chat_id: int, user_id: int, is_admin: bool) -> list[BotCommand]:
-    command_usage = await get_user_command_usage(storage, bot_id, chat_id, user_id)
-    available_commands = commands_admins if is_admin else commands_members
-    
+from redis.asyncio import Redis
+
+from tgbot.misc.default_commands import commands_admins, commands_members
+from tgbot.services.redis_migrations import migrate_fsm_data
+
+COMMAND_USAGE_MIGRATION_MARKER = "command_usage:{bot_id}:migrated"
+
+
+def command_usage_key(bot_id: int, chat_id: int, user_id: int) -> str:
+    return f"command_usage:{bot_id}:{chat_id}:{user_id}"
+
+
+def command_menu_key(bot_id: int, chat_id: int, user_id: int) -> str:
+    return f"command_menu:{bot_id}:{chat_id}:{user_id}"
+
+
+def get_sorted_command_names(command_usage: dict[str, float], is_admin: bool) -> list[str]:
+    available_commands = list((commands_admins if is_admin else commands_members).keys())
+
     def get_sort_key(cmd):
-        usage_count = command_usage.get(cmd, 0)
-        original_index = list(available_commands.keys()).index(cmd)
-        return (-usage_count, original_index)
-    
-    sorted_command_names = sorted(available_commands.keys(), key=get_sort_key)
-    
-    return [BotCommand(command=name, description=available_commands[name]) for name in sorted_command_names]
-
-async def update_user_commands(bot: Bot, chat_id: int, user_id: int, commands: list[BotCommand]):
-    await bot.set_my_commands(
-        commands,
-        scope=BotCommandScopeChatMember(chat_id=chat_id, user_id=user_id)
-    )
\ No newline at end of file
+        return (-command_usage.get(cmd, 0), available_commands.index(cmd))
+
+    return sorted(available_commands, key=get_sort_key)
+
+
+def build_commands(command_names: list[str], is_admin: bool) -> list[BotCommand]:
+    available_commands = commands_admins if is_admin else commands_members
+    return [
+        BotCommand(command=name, description=available_commands[name])
+        for name in command_names
+    ]
+
+
+class CommandMenuUpdater:
+    """
+    Keeps per-user command menus ordered by how often each command is used.
+
+    Command hits are only counted in memory by ``record``; the handler never
+    waits on Redis or the Bot API. A background worker flushes each user's
+    hits ``debounce`` seconds after the first one, adds them to the user's
+    sorted set of usage counts and recomputes the ordering. ``set_my_commands``
+    is called only when that ordering differs from the last one sent, which is
+    kept in Redis so restarts do not resend every menu.
+    """
+
+    def __init__(self, bot: Bot, redis: Redis, debounce: float = 30.0, tick: float = 1.0):
+        self.bot = bot
+        self.redis = redis
+        self.debounce = debounce
+        self.tick = tick
+        # (chat_id, user_id) -> command hits not yet written
+        self._pending: dict[tuple[int, int], Counter] = {}
+        self._is_admin: dict[tuple[int, int], bool] = {}
+        self._due: dict[tuple[int, int], float] = {}
+        self._task: asyncio.Task | None = None
+
+    def record(self, chat_id: int, user_id: int, command: str, is_admin: bool) -> None:
+        key = (chat_id, user_id)
+        self._pending.setdefault(key, Counter())[command] += 1
+        self._is_admin[key] = is_admin
+        self._due.setdefault(key, time.monotonic() + self.debounce)
+
+    async def _update_user(
+        self, chat_id: int, user_id: int, hits: Counter, is_admin: bool
+    ) -> None:
+        usage_key = command_usage_key(self.bot.id, chat_id, user_id)
+        menu_key = command_menu_key(self.bot.id, chat_id, user_id)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for command, count in hits.items():
+                pipe.zincrby(usage_key, count, command)
+            pipe.zrange(usage_key, 0, -1, withscores=True)
+            pipe.get(menu_key)
+            *_, usage, last_menu = await pipe.execute()
+
+        command_usage = {
+            (command.decode() if isinstance(command, bytes) else command): score
+            for command, score in usage
+        }
+        command_names = get_sorted_command_names(command_usage, is_admin)
+        menu = ",".join(command_names)
+        if isinstance(last_menu, bytes):
+            last_menu = last_menu.decode()
+        if menu == last_menu:
+            return
+
+        await self.bot.set_my_commands(
+            build_commands(command_names, is_admin),
+            scope=BotCommandScopeChatMember(chat_id=chat_id, user_id=user_id),
+        )
+        await self.redis.set(menu_key, menu)
+
+    async def _flush(self, force: bool = False) -> None:
+        now = time.monotonic()
+        due = [key for key, due_at in self._due.items() if force or due_at <= now]
+        for key in due:
+            del self._due[key]
+            hits = self._pending.pop(key)
+            is_admin = self._is_admin.pop(key)
+            try:
+                await self._update_user(*key, hits, is_admin)
+            except TelegramAPIError as e:
+                logging.warning(f"Could not update commands of {key}: {e}")
+            except Exception:
+                logging.exception(f"Failed to update command menu of {key}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            await self._flush()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self._flush(force=True)
+
+
+async def migrate_command_usage_from_fsm(storage: RedisStorage, bot: Bot) -> None:
+    """
+    One-shot move of ``command_usage`` counters from per-user FSM data into sorted sets.
+    """
+    redis = storage.redis
+
+    async def migrate_record(data_key: str, user_state: dict) -> bool:
+        command_usage = user_state.pop("command_usage", None)
+        if command_usage is None:
+            return False
+
+        _, bot_id, chat_id, user_id, *_ = data_key.split(":")
+        usage = {cmd: count for cmd, count in command_usage.items() if count}
+        if usage:
+            await redis.zadd(
+                command_usage_key(bot.id, int(chat_id), int(user_id)), usage
+            )
+        return True
+
+    migrated = await migrate_fsm_data(
+        storage, bot, COMMAND_USAGE_MIGRATION_MARKER.format(bot_id=bot.id), migrate_record
+    )
+    if migrated is not None:
+        logging.info(f"Migrated command usage of {migrated} users from FSM storage")
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict
+from contextlib import suppress
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from redis.asyncio import Redis
+
+PENDING_DELETIONS_KEY = "pending_deletions"
+DELETE_MESSAGES_LIMIT = 100  # Bot API deleteMessages accepts up to 100 ids
+
+
+class MessageDeleter:
+    """
+    Deletes messages after a delay without holding the update handler open.
+
+    Deletions are kept in an in-process timer wheel with one-second slots and
+    fired as bulk ``deleteMessages`` calls grouped per chat. Every pending
+    deletion is mirrored into a Redis sorted set scored by due time, so a
+    restart picks them up again instead of leaving messages behind.
+    """
+
+    def __init__(self, bot: Bot, redis: Redis, tick: float = 1.0):
+        self.bot = bot
+        self.redis = redis
+        self.tick = tick
+        self._wheel: dict[int, dict[int, set[int]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self._task: asyncio.Task | None = None
+
+    async def schedule(
+        self, chat_id: int, message_ids: list[int | None], delay: float = 5
+    ) -> None:
+        message_ids = [message_id for message_id in message_ids if message_id]
+        if not message_ids:
+            return
+
+        due_at = math.ceil(time.time() + delay)
+        self._wheel[due_at][chat_id].update(message_ids)
+        await self.redis.zadd(
+            PENDING_DELETIONS_KEY,
+            {f"{chat_id}:{message_id}": due_at for message_id in message_ids},
+        )
+
+    async def _delete(self, due: dict[int, set[int]]) -> None:
+        for chat_id, message_ids in due.items():
+            message_ids = sorted(message_ids)
+            for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+                chunk = message_ids[i : i + DELETE_MESSAGES_LIMIT]
+                try:
+                    await self.bot.delete_messages(chat_id, chunk)
+                except TelegramAPIError as e:
+                    logging.warning(f"Could not delete {chunk} in chat {chat_id}: {e}")
+
+        await self.redis.zrem(
+            PENDING_DELETIONS_KEY,
+            *[
+                f"{chat_id}:{message_id}"
+                for chat_id, message_ids in due.items()
+                for message_id in message_ids
+            ],
+        )
+
+    def _pop_due(self, now: float) -> dict[int, set[int]]:
+        due: dict[int, set[int]] = defaultdict(set)
+        for slot in [slot for slot in self._wheel if slot <= now]:
+            for chat_id, message_ids in self._wheel.pop(slot).items():
+                due[chat_id].update(message_ids)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            due = self._pop_due(time.time())
+            if not due:
+                continue
+            try:
+                await self._delete(due)
+            except Exception:
+                logging.exception("Failed to run scheduled message deletions")
+
+    async def _restore(self) -> None:
+        pending = await self.redis.zrange(PENDING_DELETIONS_KEY, 0, -1, withscores=True)
+        for member, due_at in pending:
+            if isinstance(member, bytes):
+                member = member.decode()
+            chat_id, message_id = member.rsplit(":", 1)
+            self._wheel[int(due_at)][int(chat_id)].add(int(message_id))
+        if pending:
+            logging.info(f"Restored {len(pending)} pending message deletions")
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self._restore()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        # Anything still pending stays in Redis and is restored on next start
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
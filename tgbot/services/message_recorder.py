@@ -0,0 +1,47 @@
+import logging
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from infrastructure.database.repo.requests import RequestsRepo
+from tgbot.services.write_behind import WriteBehindBuffer
+
+
+class MessageUserRecorder(WriteBehindBuffer):
+    """
+    Records message authors (MessageUser rows) with write-behind batching.
+
+    Rows are keyed by (chat_id, message_id) and flushed as one multi-row INSERT.
+    Lookups go through the buffer first, so reactions on a message that is not
+    flushed yet still resolve to its author.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        max_size: int = 200,
+        flush_interval: float = 2.0,
+    ):
+        super().__init__(max_size=max_size, flush_interval=flush_interval)
+        self.session_pool = session_pool
+
+    def add_message(self, user_id: int, chat_id: int, message_id: int) -> None:
+        self.add((chat_id, message_id), user_id)
+
+    async def write(self, batch: dict[tuple[int, int], int]) -> None:
+        rows = [
+            {"user_id": user_id, "chat_id": chat_id, "message_id": message_id}
+            for (chat_id, message_id), user_id in batch.items()
+        ]
+        async with self.session_pool() as session:
+            repo = RequestsRepo(session)
+            await repo.message_user.add_messages(rows)
+        logging.info(f"Flushed {len(rows)} message authors to the database")
+
+    async def get_user_id_by_message_id(
+        self, repo: RequestsRepo, chat_id: int, message_id: int
+    ) -> Optional[int]:
+        user_id = self.get((chat_id, message_id))
+        if user_id is not None:
+            return user_id
+        return await repo.message_user.get_user_id_by_message_id(chat_id, message_id)
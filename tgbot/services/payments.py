@@ -1,26 +1,49 @@
 from aiogram import Bot
 from aiogram.types import LabeledPrice
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from redis.asyncio import Redis
 
+AI_USAGE_PRICE = 40  # Telegram Stars (XTR)
+INVOICE_LINK_TTL = 30 * 24 * 60 * 60  # 30 days
 
-async def create_invoice(bot: Bot, usage_usd: float, group_id: int):
+
+async def create_invoice(bot: Bot, group_id: int, price: int = AI_USAGE_PRICE):
     return await bot.create_invoice_link(
         title="AI Usage",
-        description=f"Chatbot AI usage for ${usage_usd:.2f}",
+        description="Chatbot AI usage",
         payload=str(group_id),
         provider_token="",
         currency="XTR",
         prices=[
-            LabeledPrice(label="label", amount=40),
+            LabeledPrice(label="label", amount=price),
         ],
     )
 
 
-async def payment_keyboard(bot: Bot, usage_usd: float, group_id: int):
+async def get_invoice_link(
+    bot: Bot, redis: Redis, group_id: int, price: int = AI_USAGE_PRICE
+) -> str:
+    """
+    Invoice links only depend on the group and the price, so they are created once
+    and shared through Redis instead of calling createInvoiceLink on every throttle.
+    """
+    key = f"invoice_link:{bot.id}:{group_id}:{price}"
+    invoice = await redis.get(key)
+    if invoice:
+        return invoice.decode() if isinstance(invoice, bytes) else invoice
+
+    invoice = await create_invoice(bot, group_id, price)
+    await redis.set(key, invoice, ex=INVOICE_LINK_TTL)
+    return invoice
+
+
+async def payment_keyboard(
+    bot: Bot, redis: Redis, group_id: int, price: int = AI_USAGE_PRICE
+):
     kbd = InlineKeyboardBuilder()
-    invoice = await create_invoice(bot, usage_usd, group_id)
+    invoice = await get_invoice_link(bot, redis, group_id, price)
     kbd.button(
-        text="Оплатити 40 ⭐️ за ШІ",
+        text=f"Оплатити {price} ⭐️ за ШІ",
         url=invoice,
     )
     return kbd.as_markup()
@@ -0,0 +1,106 @@
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from enum import Enum
+
+from redis.asyncio import Redis
+
+
+class RateLimitMode(str, Enum):
+    FIXED_WINDOW = "fixed_window"
+    SLIDING_WINDOW = "sliding_window"
+    TOKEN_BUCKET = "token_bucket"
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    retry_after: int  # Seconds until the next hit would be allowed, 0 if allowed
+
+
+# Every script takes KEYS[1] = limiter key, ARGV[1] = window (ms),
+# ARGV[2] = max hits per window, and returns {allowed, retry_after_ms}.
+
+FIXED_WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current >= tonumber(ARGV[2]) then
+    return {0, redis.call('PTTL', KEYS[1])}
+end
+if redis.call('INCR', KEYS[1]) == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return {1, 0}
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local window = tonumber(ARGV[1])
+local now = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, tonumber(oldest[2]) + window - now}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('PEXPIRE', KEYS[1], window)
+return {1, 0}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local window = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local rate = capacity / window
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+if tokens < 1 then
+    return {0, math.ceil((1 - tokens) / rate)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+return {1, 0}
+"""
+
+
+class RateLimiter:
+    """
+    Decides whether a hit is allowed in a single atomic Redis round-trip.
+
+    The check, the counter update and the remaining wait time are all computed
+    by one Lua script, so concurrent updates cannot slip past the limit.
+    """
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self._scripts = {
+            RateLimitMode.FIXED_WINDOW: redis.register_script(FIXED_WINDOW_SCRIPT),
+            RateLimitMode.SLIDING_WINDOW: redis.register_script(SLIDING_WINDOW_SCRIPT),
+            RateLimitMode.TOKEN_BUCKET: redis.register_script(TOKEN_BUCKET_SCRIPT),
+        }
+
+    async def hit(
+        self,
+        key: str,
+        limit: float,
+        max_times: int,
+        mode: RateLimitMode | str = RateLimitMode.FIXED_WINDOW,
+    ) -> RateLimitResult:
+        """
+        :param key: Redis key of the limiter.
+        :param limit: Window length in seconds.
+        :param max_times: Hits allowed per window (bucket capacity for token bucket).
+        :param mode: Limiting algorithm.
+        """
+        script = self._scripts[RateLimitMode(mode)]
+        window_ms = max(int(limit * 1000), 1)
+        now_ms = int(time.time() * 1000)
+        allowed, retry_after_ms = await script(
+            keys=[key],
+            args=[window_ms, max_times, now_ms, f"{now_ms}-{uuid.uuid4().hex}"],
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            retry_after=math.ceil(max(int(retry_after_ms), 0) / 1000),
+        )
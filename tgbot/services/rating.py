@@ -1,4 +1,8 @@
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
+
+from cachetools import TLRUCache
+from redis.asyncio import Redis
 
 from infrastructure.database.repo.requests import RequestsRepo
 from aiogram.types import (
@@ -61,27 +65,49 @@ def get_reaction_change(
             return InterationType.NEGATIVE
 
 
-def is_rating_cached(helper_id: int, user_id: int, ratings_cache: dict) -> bool:
-    key = (helper_id, user_id)
-    now = datetime.now()
+class ReactionDedupe:
+    """
+    Lets one rating reaction per (helper, user) pair through every ``ttl``.
+
+    The window is claimed with an atomic ``SET NX PX`` in Redis, so every bot
+    process shares it. Pairs known to be inside a window are also kept in a
+    bounded in-process cache until that window ends, so repeated reactions are
+    rejected without a Redis round-trip.
+    """
+
+    def __init__(
+        self, redis: Redis, ttl: timedelta = RATING_CACHE_TTL, maxsize: int = 10_000
+    ):
+        self.redis = redis
+        self.ttl_ms = int(ttl.total_seconds() * 1000)
+        # Value is the monotonic time at which the window ends
+        self._local = TLRUCache(
+            maxsize=maxsize,
+            ttu=lambda _key, expires_at, _now: expires_at,
+            timer=time.monotonic,
+        )
+
+    @staticmethod
+    def _key(helper_id: int, user_id: int) -> str:
+        return f"rating_reaction:{helper_id}:{user_id}"
+
+    async def is_duplicate(self, helper_id: int, user_id: int) -> bool:
+        key = (helper_id, user_id)
+        if key in self._local:
+            return True
 
-    if key in ratings_cache:
-        # Check if the cache entry is still valid (e.g., within 1 minute)
-        if now - ratings_cache[key] < RATING_CACHE_TTL:
-            return True  # It's a duplicate within the time window
+        async with self.redis.pipeline() as pipe:
+            pipe.set(self._key(helper_id, user_id), 1, nx=True, px=self.ttl_ms)
+            pipe.pttl(self._key(helper_id, user_id))
+            claimed, ttl_ms = await pipe.execute()
 
-    # Update the cache
-    ratings_cache[key] = now
-    return False
+        if ttl_ms > 0:
+            self._local[key] = time.monotonic() + ttl_ms / 1000
+        return not claimed
 
 
 async def change_rating(helper_id: int, chat_id: int, change: int, repo: RequestsRepo) -> tuple[int, int]:
-    current_rating = await repo.rating_users.get_rating_by_user_id(helper_id, chat_id)
-    if current_rating is None:
-        await repo.rating_users.add_user_for_rating(helper_id, chat_id, change)
-        return 0, change
-    new_rating = await repo.rating_users.increment_rating_by_user_id(helper_id, chat_id, change)
-    return current_rating, new_rating or 0
+    return await repo.rating_users.upsert_rating(helper_id, chat_id, change)
 
 
 def calculate_rating_change(
@@ -108,8 +134,9 @@ async def reaction_rating_calculator(
     reaction: MessageReactionUpdated, repo: RequestsRepo, helper_id: int, actor_id: int
 ) -> int:
     chat_id = reaction.chat.id
-    helper_rating = await repo.rating_users.get_rating_by_user_id(helper_id, chat_id) or 0
-    actor_rating = await repo.rating_users.get_rating_by_user_id(actor_id, chat_id) or 0
+    ratings = await repo.rating_users.get_ratings(chat_id, [helper_id, actor_id])
+    helper_rating = ratings.get(helper_id, 0)
+    actor_rating = ratings.get(actor_id, 0)
 
     helper_rank = UserRank.from_rating(helper_rating)
     actor_rank = UserRank.from_rating(actor_rating)
@@ -0,0 +1,107 @@
+import datetime
+import itertools
+import logging
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from infrastructure.database.repo.requests import RequestsRepo
+from tgbot.services.write_behind import WriteBehindBuffer
+
+RATING_EVENTS_RETENTION = datetime.timedelta(days=30)
+
+
+class RatingEventSource(str, Enum):
+    REACTION = "reaction"
+    TOPUP = "topup"
+    ADMIN = "admin"
+    CASINO = "casino"
+    INFLATION = "inflation"
+    MODERATION = "moderation"
+    NEW_MEMBER = "new_member"
+    WIPE = "wipe"
+
+
+def rating_event(
+    chat_id: int,
+    target_id: int,
+    delta: int,
+    source: RatingEventSource,
+    actor_id: Optional[int] = None,
+) -> dict:
+    return {
+        "chat_id": chat_id,
+        "target_id": target_id,
+        "actor_id": actor_id,
+        "delta": delta,
+        "source": RatingEventSource(source).value,
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+    }
+
+
+class RatingEventRecorder(WriteBehindBuffer):
+    """
+    Appends rating changes to the RatingEvents ledger in batches.
+
+    Every event gets its own key, so nothing is coalesced; the buffer only
+    turns many single-row inserts into one multi-row INSERT. The timestamp is
+    taken when the event is recorded, not when it is flushed.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        max_size: int = 200,
+        flush_interval: float = 5.0,
+    ):
+        super().__init__(max_size=max_size, flush_interval=flush_interval)
+        self.session_pool = session_pool
+        self._sequence = itertools.count()
+
+    def record(
+        self,
+        chat_id: int,
+        target_id: int,
+        delta: int,
+        source: RatingEventSource,
+        actor_id: Optional[int] = None,
+    ) -> None:
+        if delta:
+            self.add(
+                next(self._sequence),
+                rating_event(chat_id, target_id, delta, source, actor_id),
+            )
+
+    async def write(self, batch: dict[int, dict]) -> None:
+        async with self.session_pool() as session:
+            repo = RequestsRepo(session)
+            await repo.rating_events.add_events(list(batch.values()))
+        logging.info(f"Flushed {len(batch)} rating events to the database")
+
+
+def rating_seen_key(chat_id: int, viewer: str) -> str:
+    return f"rating_seen:{chat_id}:{viewer}"
+
+
+async def get_deltas_since_seen(
+    repo: RequestsRepo, chat_id: int, viewer: str, user_ids: list[int]
+) -> dict[int, int]:
+    """
+    Rating change of each user since ``viewer`` last looked, and mark it as seen now.
+
+    ``viewer`` names what is being looked at, e.g. one user's /rating or the
+    chat's /top. The first look shows no change, like the old previous-rating
+    snapshots did.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    last_seen = await repo.redis.set(
+        rating_seen_key(chat_id, viewer),
+        int(now.timestamp()),
+        ex=RATING_EVENTS_RETENTION,
+        get=True,
+    )
+    if last_seen is None:
+        return {}
+    since = datetime.datetime.fromtimestamp(int(last_seen), datetime.timezone.utc)
+    return await repo.rating_events.get_deltas(chat_id, user_ids, since)
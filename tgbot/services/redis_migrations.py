@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import Redis
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError
+
+MIGRATION_LOCK_TTL = 60
+
+
+async def _keep_lock(lock: Lock) -> None:
+    while True:
+        await asyncio.sleep(MIGRATION_LOCK_TTL / 3)
+        await lock.reacquire()
+
+
+async def run_once(redis: Redis, marker: str, migration: Callable[[], Awaitable[Any]]) -> bool:
+    """
+    Run a one-shot data migration unless ``marker`` is already set.
+
+    Instances exclude each other with a short-lived lock that is renewed while the
+    migration runs, so a crashed instance frees it within ``MIGRATION_LOCK_TTL``.
+    The marker is set only after the migration succeeds; a failed one is retried
+    on the next start. Returns whether the migration ran here.
+    """
+    if await redis.exists(marker):
+        return False
+
+    lock = redis.lock(f"{marker}:lock", timeout=MIGRATION_LOCK_TTL)
+    if not await lock.acquire(blocking=False):
+        logging.info(f"Migration {marker} is running on another instance")
+        return False
+
+    keeper = asyncio.create_task(_keep_lock(lock))
+    try:
+        # Another instance may have finished between the check and the lock
+        if await redis.exists(marker):
+            return False
+        await migration()
+        await redis.set(marker, int(time.time()))
+        return True
+    finally:
+        keeper.cancel()
+        with suppress(asyncio.CancelledError, LockError):
+            await keeper
+        with suppress(LockError):
+            await lock.release()
+
+
+async def migrate_fsm_data(
+    storage: RedisStorage,
+    bot: Bot,
+    marker: str,
+    migrate_record: Callable[[str, dict], Awaitable[bool]],
+) -> Optional[int]:
+    """
+    Run ``migrate_record`` once over the FSM data of every chat and user of the bot.
+
+    ``migrate_record`` gets the data key and the decoded data, changes the data in
+    place and returns whether it did; changed data is written back keeping its TTL.
+    Returns the number of changed records, or None if the migration did not run.
+    """
+    redis = storage.redis
+    migrated = 0
+
+    async def migration() -> None:
+        nonlocal migrated
+        pattern = storage.key_builder.build(StorageKey(bot.id, "*", "*"), "data")
+        async for data_key in redis.scan_iter(match=pattern):
+            raw = await redis.get(data_key)
+            if not raw:
+                continue
+            if isinstance(data_key, bytes):
+                data_key = data_key.decode()
+            data: dict = json.loads(raw)
+            if await migrate_record(data_key, data):
+                await redis.set(data_key, json.dumps(data), keepttl=True)
+                migrated += 1
+
+    if not await run_once(redis, marker, migration):
+        return None
+    return migrated
@@ -1,10 +1,12 @@
 import logging
+import re
 from dataclasses import dataclass
 
 from aiogram import Bot
-from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.storage.redis import RedisStorage
 
+from tgbot.services.redis_migrations import migrate_fsm_data
+
 
 @dataclass
 class ModelPricing:
@@ -18,20 +20,74 @@ Sonnet = ModelPricing(input_price=3, output_price=15)
 Opus = ModelPricing(input_price=15, output_price=75)
 
 
+def usage_cost(model_pricing: ModelPricing, input_usage: int, output_usage: int) -> float:
+    total_cost = (
+        model_pricing.input_price * input_usage
+        + model_pricing.output_price * output_usage
+    ) / 1_000_000
+    return round(total_cost, 2)
+
+
+@dataclass
+class UsageSnapshot:
+    """
+    Token usage of one user, read once per update.
+
+    ThrottlingMiddleware puts it into handler data as ``usage_snapshot`` so the
+    cost is not fetched again by the handler, and the post-answer update is
+    written through it.
+    """
+
+    manager: "TokenUsageManager"
+    group_id: int
+    user_id: int
+    input: int = 0
+    output: int = 0
+
+    def calculate_cost(self, model_pricing: ModelPricing) -> float:
+        return usage_cost(model_pricing, self.input, self.output)
+
+    async def update_usage(self, input_usage_delta: int, output_usage_delta: int):
+        await self.manager.update_usage(
+            self.group_id, self.user_id, input_usage_delta, output_usage_delta
+        )
+        self.input += int(input_usage_delta)
+        self.output += int(output_usage_delta)
+
+
 class TokenUsageManager:
+    """
+    Keeps AI token usage as per-(group, user) Redis hashes.
+
+    Each user has its own ``token_usage:{bot_id}:{group_id}:{user_id}`` hash with
+    ``input`` and ``output`` counters, so updates are atomic HINCRBYs and reads
+    never touch other users' usage.
+    """
+
     def __init__(self, storage: RedisStorage, bot: Bot):
         self.storage = storage
         self.bot = bot
 
-    async def get_usage(self, group_id: int, user_id: int) -> dict:
-        key = f"{group_id}_{user_id}"
-        storage_key = StorageKey(self.bot.id, group_id, group_id)
-
-        # Attempt to retrieve group data from storage
-        group_state: dict = await self.storage.get_data(storage_key)
+    def _usage_key(self, group_id: int, user_id: int) -> str:
+        return f"token_usage:{self.bot.id}:{group_id}:{user_id}"
 
-        # Return usage data if present, else default to 0 for both input and output
-        return group_state.get(key, {"input": 0, "output": 0})
+    async def get_usage(self, group_id: int, user_id: int) -> dict:
+        usage = await self.storage.redis.hgetall(self._usage_key(group_id, user_id))
+        usage = {
+            (field.decode() if isinstance(field, bytes) else field): int(value)
+            for field, value in usage.items()
+        }
+        return {"input": usage.get("input", 0), "output": usage.get("output", 0)}
+
+    async def get_snapshot(self, group_id: int, user_id: int) -> UsageSnapshot:
+        usage = await self.get_usage(group_id, user_id)
+        return UsageSnapshot(
+            manager=self,
+            group_id=group_id,
+            user_id=user_id,
+            input=usage["input"],
+            output=usage["output"],
+        )
 
     async def update_usage(
         self,
@@ -40,23 +96,15 @@ class TokenUsageManager:
         input_usage_delta: int,
         output_usage_delta: int,
     ):
-        key = f"{group_id}_{user_id}"
-        storage_key = StorageKey(self.bot.id, group_id, group_id)
-
-        # Retrieve current state or initialize if absent
-        group_state: dict = await self.storage.get_data(storage_key)
-        user_usage = group_state.get(key, {"input": 0, "output": 0})
-
-        # Update usage data with new deltas
-        user_usage["input"] += input_usage_delta
-        user_usage["output"] += output_usage_delta
-        group_state[key] = user_usage
+        key = self._usage_key(group_id, user_id)
+        async with self.storage.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(key, "input", int(input_usage_delta))
+            pipe.hincrby(key, "output", int(output_usage_delta))
+            input_usage, output_usage = await pipe.execute()
 
         logging.info(
-            f'User {user_id} usage updated: {user_usage["input"]} input, {user_usage["output"]} output'
+            f"User {user_id} usage updated: {input_usage} input, {output_usage} output"
         )
-        # Save updated state back to storage
-        await self.storage.set_data(storage_key, group_state)
 
     async def calculate_cost(
         self, model_pricing: ModelPricing, group_id: int, user_id: int
@@ -67,20 +115,42 @@ class TokenUsageManager:
             f"Calculating cost for user {user_id} with {usage['input']} input and {usage['output']} output"
         )
         # Calculate total cost based on model pricing and accumulated usage
-        total_cost = (
-            model_pricing.input_price * usage["input"]
-            + model_pricing.output_price * usage["output"]
-        ) / 1_000_000
-        return round(total_cost, 2)
+        return usage_cost(model_pricing, usage["input"], usage["output"])
 
     async def reset_usage(self, group_id: int, user_id: int):
-        key = f"{group_id}_{user_id}"
-        storage_key = StorageKey(self.bot.id, group_id, group_id)
+        await self.storage.redis.delete(self._usage_key(group_id, user_id))
+        logging.info(f"User {user_id} usage reset")
 
-        # Retrieve current state or initialize if absent
-        group_state: dict = await self.storage.get_data(storage_key)
-        group_state[key] = {"input": 0, "output": 0}
 
-        # Save updated state back to storage
-        await self.storage.set_data(storage_key, group_state)
-        logging.info(f"User {user_id} usage reset")
+USAGE_ENTRY_REGEX = re.compile(r"^(-?\d+)_(\d+)$")
+USAGE_MIGRATION_MARKER = "token_usage:{bot_id}:migrated"
+
+
+async def migrate_usage_from_fsm(storage: RedisStorage, bot: Bot) -> None:
+    """
+    One-shot move of token usage from per-group FSM data into per-user hashes.
+
+    Usage used to live in the group's FSM data as ``{"<group_id>_<user_id>": {"input", "output"}}``
+    entries. They are added to the new counters and removed from the FSM data.
+    """
+    manager = TokenUsageManager(storage=storage, bot=bot)
+
+    async def migrate_record(data_key: str, group_state: dict) -> bool:
+        usage_entries = {
+            key: value
+            for key, value in group_state.items()
+            if USAGE_ENTRY_REGEX.match(key)
+            and isinstance(value, dict)
+            and {"input", "output"} <= value.keys()
+        }
+        for key, usage in usage_entries.items():
+            group_id, user_id = map(int, USAGE_ENTRY_REGEX.match(key).groups())
+            await manager.update_usage(group_id, user_id, usage["input"], usage["output"])
+            del group_state[key]
+        return bool(usage_entries)
+
+    migrated = await migrate_fsm_data(
+        storage, bot, USAGE_MIGRATION_MARKER.format(bot_id=bot.id), migrate_record
+    )
+    if migrated is not None:
+        logging.info(f"Migrated token usage from {migrated} group FSM records")
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from typing import Any, Hashable
+
+
+class WriteBehindBuffer(ABC):
+    """
+    In-process buffer that collects writes and flushes them in batches.
+
+    Items are keyed, so a repeated key overwrites the pending value instead of
+    producing a second write. A flush is triggered when the buffer reaches
+    ``max_size`` items or every ``flush_interval`` seconds, whichever comes first.
+    Subclasses implement ``write`` to persist one batch.
+
+    A failed batch is requeued and retried with exponential backoff. Once an
+    item has failed ``max_retries`` times it is written on its own, so one bad
+    row cannot block the rest, and dropped (logged) if that fails too. At most
+    ``max_pending`` items are kept; the oldest are dropped beyond that.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 100,
+        flush_interval: float = 2.0,
+        max_retries: int = 5,
+        max_pending: int = 10000,
+        max_backoff: float = 60.0,
+    ):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self._pending: dict[Hashable, Any] = {}
+        self._in_flight: dict[Hashable, Any] = {}
+        self._failures: dict[Hashable, int] = {}
+        self._retry_at = 0.0
+        self._backoff = 0.0
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._size_flush: asyncio.Task | None = None
+
+    @abstractmethod
+    async def write(self, batch: dict[Hashable, Any]) -> None:
+        """Persist one batch; raising requeues it."""
+
+    def add(self, key: Hashable, value: Any) -> None:
+        self._pending[key] = value
+        self._trim()
+        if len(self._pending) >= self.max_size and not (
+            self._size_flush and not self._size_flush.done()
+        ):
+            self._size_flush = asyncio.create_task(self.flush())
+
+    def discard(self, key: Hashable) -> None:
+        """Drop a buffered value that has not been written yet."""
+        self._pending.pop(key, None)
+        self._failures.pop(key, None)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a value that is buffered or being written, but not yet persisted."""
+        if key in self._pending:
+            return self._pending[key]
+        return self._in_flight.get(key, default)
+
+    def _trim(self) -> None:
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return
+        for key in list(self._pending)[:overflow]:
+            del self._pending[key]
+            self._failures.pop(key, None)
+        logging.error(
+            f"{type(self).__name__}: buffer is full, dropped the {overflow} oldest items"
+        )
+
+    async def _write_separately(self, items: dict[Hashable, Any]) -> None:
+        for key, value in items.items():
+            self._failures.pop(key, None)
+            try:
+                await self.write({key: value})
+            except Exception:
+                logging.exception(
+                    f"{type(self).__name__}: dropping {key!r} after {self.max_retries} failed writes: {value!r}"
+                )
+
+    async def _requeue(self, batch: dict[Hashable, Any]) -> None:
+        retry, exhausted = {}, {}
+        for key, value in batch.items():
+            self._failures[key] = self._failures.get(key, 0) + 1
+            if self._failures[key] >= self.max_retries:
+                exhausted[key] = value
+            else:
+                retry[key] = value
+
+        if exhausted:
+            await self._write_separately(exhausted)
+        # Newer values for the same keys win over the failed batch
+        self._pending = {**retry, **self._pending}
+        self._trim()
+
+    async def flush(self, force: bool = False) -> None:
+        async with self._flush_lock:
+            if not self._pending or (not force and time.monotonic() < self._retry_at):
+                return
+            self._in_flight, self._pending = self._pending, {}
+            try:
+                await self.write(self._in_flight)
+            except Exception:
+                logging.exception(
+                    f"{type(self).__name__}: failed to write {len(self._in_flight)} items, requeueing"
+                )
+                self._backoff = min(
+                    max(self._backoff * 2, self.flush_interval), self.max_backoff
+                )
+                self._retry_at = time.monotonic() + self._backoff
+                await self._requeue(self._in_flight)
+            else:
+                self._backoff = 0.0
+                self._retry_at = 0.0
+                for key in self._in_flight:
+                    self._failures.pop(key, None)
+            finally:
+                self._in_flight = {}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the periodic flush and drain everything that is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush(force=True)
+
+
+class DebouncedWriteBuffer(WriteBehindBuffer):
+    """
+    Write-behind buffer that accepts a key at most once per ``min_interval`` seconds.
+
+    ``offer`` is meant for hot paths that see the same key on every update: an
+    offer is ignored while the key was accepted recently, unless its
+    ``fingerprint`` differs from the one accepted last.
+    """
+
+    def __init__(self, min_interval: int, **kwargs):
+        super().__init__(**kwargs)
+        self.min_interval = min_interval
+        self._accepted: dict[Hashable, tuple[Any, int]] = {}
+
+    def offer(self, key: Hashable, value: Any, fingerprint: Any = None) -> bool:
+        """Buffer ``value`` unless ``key`` was accepted recently; returns whether it was."""
+        now = int(time.time())
+        last_fingerprint, accepted_at = self._accepted.get(key, (None, 0))
+        if fingerprint == last_fingerprint and now - accepted_at < self.min_interval:
+            return False
+        self._accepted[key] = (fingerprint, now)
+        self.add(key, value)
+        return True
+
+    def forget(self, key: Hashable) -> None:
+        """Drop the pending value and debounce state, so the next ``offer`` is accepted."""
+        self.discard(key)
+        self._accepted.pop(key, None)
+
+    async def flush(self, force: bool = False) -> None:
+        await super().flush(force=force)
+        # Entries past the suppression window would be accepted anyway, drop them
+        threshold = int(time.time()) - self.min_interval
+        self._accepted = {
+            key: value for key, value in self._accepted.items() if value[1] > threshold
+        }